@@ -0,0 +1,95 @@
+"""
+Database profile of the project, configured from the environment:
+
+RESTBUCKS_DB_ENGINE           sqlite (default) or postgresql
+RESTBUCKS_DB_NAME             database name, or the file of the SQLite database
+RESTBUCKS_DB_USER             PostgreSQL user
+RESTBUCKS_DB_PASSWORD         PostgreSQL password
+RESTBUCKS_DB_HOST             PostgreSQL host
+RESTBUCKS_DB_PORT             PostgreSQL port
+RESTBUCKS_DB_CONN_MAX_AGE     seconds connections are kept open for reuse
+RESTBUCKS_DB_POOLER           pgbouncer when connecting through its transaction pool
+RESTBUCKS_DB_REPLICAS         comma separated read replica hosts, or SQLite files
+RESTBUCKS_SQLITE_BUSY_TIMEOUT milliseconds a SQLite writer waits for the lock
+RESTBUCKS_SQLITE_MMAP_SIZE    bytes of the SQLite database file mapped in memory
+"""
+import os
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def database_config(base_dir, environ=os.environ) -> dict:
+    """
+    Returns the default database settings of the environment.
+
+    :return dict: database settings
+    """
+    conn_max_age = int(environ.get("RESTBUCKS_DB_CONN_MAX_AGE", 60))
+    if environ.get("RESTBUCKS_DB_ENGINE", "sqlite") == "postgresql":
+        config = {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": environ.get("RESTBUCKS_DB_NAME", "restbucks"),
+            "USER": environ.get("RESTBUCKS_DB_USER", ""),
+            "PASSWORD": environ.get("RESTBUCKS_DB_PASSWORD", ""),
+            "HOST": environ.get("RESTBUCKS_DB_HOST", ""),
+            "PORT": environ.get("RESTBUCKS_DB_PORT", ""),
+            "CONN_MAX_AGE": conn_max_age,
+        }
+        if environ.get("RESTBUCKS_DB_POOLER") == "pgbouncer":
+            # the pool hands out a server connection per transaction, so
+            # cursors can't outlive one.
+            config["DISABLE_SERVER_SIDE_CURSORS"] = True
+        return config
+    return {
+        "ENGINE": "RestBucks.backends.sqlite3",
+        "NAME": environ.get("RESTBUCKS_DB_NAME", base_dir / "db.sqlite3"),
+        "CONN_MAX_AGE": conn_max_age,
+        # concurrent writers queue for the lock instead of failing.
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+    }
+
+
+def replica_configs(primary: dict, environ=os.environ) -> dict:
+    """
+    Returns the settings of the read replicas of the primary database, named
+    replica1, replica2 and so on. Tests run them as mirrors of the primary.
+
+    :return dict: database settings by alias
+    """
+    locations = [
+        location.strip()
+        for location in environ.get("RESTBUCKS_DB_REPLICAS", "").split(",")
+        if location.strip()
+    ]
+    key = "NAME" if primary["ENGINE"] == "RestBucks.backends.sqlite3" else "HOST"
+    return {
+        f"replica{index}": {**primary, key: location, "TEST": {"MIRROR": "default"}}
+        for index, location in enumerate(locations, 1)
+    }
+
+
+def sqlite_pragmas(environ=os.environ) -> dict:
+    """
+    Returns the pragmas every new SQLite connection is configured with.
+
+    :return dict: pragma values by name
+    """
+    return {
+        # readers no longer block the writer, nor the writer the readers.
+        "journal_mode": "WAL",
+        # in WAL mode a crash can't corrupt the database, only lose the last commits.
+        "synchronous": "NORMAL",
+        "busy_timeout": int(environ.get("RESTBUCKS_SQLITE_BUSY_TIMEOUT", 5000)),
+        "mmap_size": int(environ.get("RESTBUCKS_SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    }
+
+
+@receiver(connection_created, dispatch_uid="configure_sqlite_connection")
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
@@ -0,0 +1,141 @@
+import asyncio
+import contextvars
+import itertools
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+
+# the request being handled, so the router can tell reads of safe requests.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def get_pin_key(user_id) -> str:
+    return f"db:primary-pin:{user_id}"
+
+
+def pin_to_primary(user_id) -> None:
+    """
+    Sends the reads of the user to the primary for REPLICA_PIN_SECONDS, so they
+    see their own writes before the replicas catch up.
+
+    """
+    cache.set(get_pin_key(user_id), True, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+@sync_and_async_middleware
+class ReplicaPinMiddleware:
+    """
+    Makes the request available to the router, and pins the user to the
+    primary after a successful unsafe request. Runs on the event loop in front
+    of async views.
+
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # marks the instance as a coroutine function for the handler.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.pin_after_write(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = current_request.set(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.pin_after_write(request, response)
+        return response
+
+    @staticmethod
+    def pin_after_write(request, response) -> None:
+        user = getattr(request, "user", None)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        ):
+            pin_to_primary(user.pk)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of the product app made by safe requests to the
+    DATABASE_REPLICAS in turn. Reads stay on the primary outside requests,
+    inside transactions, during unsafe requests and while the user is pinned
+    after writing. Everything else is left to the primary.
+
+    The primary_models are always read from the primary, as their reads fill
+    the caches tagged with the catalog version, which a lagging replica would
+    fill with the previous catalog.
+
+    """
+
+    app_labels = ("product",)
+    primary_models = ("product.product",)
+    primary = "default"
+
+    def __init__(self):
+        self._turn = itertools.count()
+
+    def use_primary(self) -> bool:
+        if connections[self.primary].in_atomic_block:
+            return True
+        # management commands and other work outside requests.
+        if (request := current_request.get()) is None:
+            return True
+        if request.method not in SAFE_METHODS:
+            return True
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            return False
+        # the pin is looked up once per request and user, not once per query.
+        pin = getattr(request, "_primary_pin", None)
+        if pin is None or pin[0] != user.pk:
+            pin = (user.pk, cache.get(get_pin_key(user.pk)) is not None)
+            request._primary_pin = pin
+        return pin[1]
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.app_labels:
+            return None
+        replicas = getattr(settings, "DATABASE_REPLICAS", ())
+        if (
+            not replicas
+            or model._meta.label_lower in self.primary_models
+            or self.use_primary()
+        ):
+            return self.primary
+        return replicas[next(self._turn) % len(replicas)]
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in self.app_labels:
+            return None
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {self.primary, *getattr(settings, "DATABASE_REPLICAS", ())}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema from the primary.
+        if db in getattr(settings, "DATABASE_REPLICAS", ()):
+            return False
+        return None
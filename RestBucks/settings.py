@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .db import database_config, replica_configs, sqlite_pragmas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +44,7 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     # libraries
     "rest_framework",
+    "rest_framework.authtoken",
     # apps
     "product",
 ]
@@ -51,10 +55,18 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "RestBucks.routers.ReplicaPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Opt-in per request timing, query counting and the local /metrics endpoint.
+INSTRUMENTATION_ENABLED = os.environ.get("RESTBUCKS_INSTRUMENTATION") == "1"
+# Requests running more queries than this are logged and flagged.
+INSTRUMENTATION_QUERY_BUDGET = 20
+if INSTRUMENTATION_ENABLED:
+    MIDDLEWARE.append("product.middleware.InstrumentationMiddleware")
+
 ROOT_URLCONF = "RestBucks.urls"
 
 TEMPLATES = [
@@ -79,13 +91,49 @@ WSGI_APPLICATION = "RestBucks.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# configured by the RESTBUCKS_DB_* environment variables listed in RestBucks/db.py.
 DATABASES = {
+    "default": database_config(BASE_DIR),
+}
+DATABASES.update(replica_configs(DATABASES["default"]))
+
+# Reads of the product app go to the replicas in turn, see RestBucks/routers.py.
+DATABASE_ROUTERS = ["RestBucks.routers.ReplicaRouter"]
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+# Seconds the reads of a user stay on the primary after they write.
+REPLICA_PIN_SECONDS = 5
+
+# Pragmas every new SQLite connection runs, see RestBucks/db.py.
+SQLITE_PRAGMAS = sqlite_pragmas()
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     }
 }
 
+# Seconds a rendered product catalog payload is kept in the cache.
+PRODUCT_CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+# Threads running the queries of the async views, bounding their concurrency.
+ASYNC_ORM_THREADS = 8
+
+# Longest wait in seconds of a barista queue long poll or server sent event.
+ORDER_QUEUE_TIMEOUT = 25
+
+# Shortest wait in seconds between two server sent events of the barista queue.
+ORDER_QUEUE_MIN_STREAM_TIMEOUT = 1
+
+# Seconds responses of requests with an Idempotency-Key header are replayed for.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Seconds after which a key of a request that never finished can be used again.
+IDEMPOTENCY_PROCESSING_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -109,13 +157,46 @@ AUTH_PASSWORD_VALIDATORS = [
 # Django rest framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.BasicAuthentication",
+        "product.authentication.CachedTokenAuthentication",
+        "product.authentication.ThrottledBasicAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "product.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PAGINATION_CLASS": "product.pagination.IdCursorPagination",
+    "PAGE_SIZE": 50,
+    "DEFAULT_THROTTLE_CLASSES": [
+        "product.throttling.UserBucketThrottle",
+        "product.throttling.AddressBucketThrottle",
+    ],
+    # generous defaults, meant to stop runaway clients rather than normal use.
+    "DEFAULT_THROTTLE_RATES": {
+        "user_read": "6000/min",
+        "user_write": "600/min",
+        "address_read": "20000/min",
+        "address_write": "2000/min",
+        "failed_authentication": "30/min",
+    },
+    # trusted proxies in front of the app, only their X-Forwarded-For addresses
+    # are used to throttle clients.
+    "NUM_PROXIES": int(os.environ.get("RESTBUCKS_NUM_PROXIES", 0)),
 }
 
+# Largest page size clients can ask for with the page_size query parameter.
+API_MAX_PAGE_SIZE = 500
+
+# Unfiltered admin changelists of tables estimated to have at least this many
+# rows show the estimate instead of counting every row.
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Seconds and number of users resolved from tokens kept in process.
+TOKEN_AUTHENTICATION_CACHE_TIMEOUT = 60
+TOKEN_AUTHENTICATION_CACHE_SIZE = 10000
+
 # Email Stuff
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
@@ -1,11 +1,16 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from product.middleware import metrics_view
 from product.urls import urlpatterns as product_urls
+from product.views import ObtainAuthTokenView
 
-api_urls = product_urls
+api_urls = product_urls + [
+    path("auth/token/", ObtainAuthTokenView.as_view(), name="auth-token"),
+]
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(api_urls)),
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -1,8 +1,44 @@
 from django.contrib import admin
 
-from .models import Product, Order, OrderDetail
+from .models import Product, Order, OrderDetail, OrderStatusNotification
+from .pagination import EstimatedCountPaginator
 
-# TODO: add filter for admins
+
+class UserFilter(admin.SimpleListFilter):
+    """
+    Filters the orders by a typed in user id or username, instead of listing
+    every user in the sidebar.
+
+    """
+
+    title = "user"
+    parameter_name = "user"
+    template = "admin/product/input_filter.html"
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self) -> bool:
+        return True
+
+    def choices(self, changelist):
+        # the other parameters of the changelist, kept by the filter form.
+        yield {
+            "value": self.value() or "",
+            "placeholder": "id or username",
+            "params": [
+                (name, value)
+                for name, value in changelist.get_filters_params().items()
+                if name != self.parameter_name
+            ],
+        }
+
+    def queryset(self, request, queryset):
+        if not (value := self.value()):
+            return queryset
+        if value.isdigit():
+            return queryset.filter(user_id=int(value))
+        return queryset.filter(user__username=value)
 
 
 @admin.register(Product)
@@ -13,8 +49,45 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ("user", "status", "product_list", "total_price")
+    list_filter = ("status", UserFilter)
+    # skip the COUNT(*) over the whole table next to the filtered count.
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ("move_to_preparation", "move_to_ready", "move_to_delivered")
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .select_related("user")
+            .prefetch_related("products")
+        )
+
+    def transition_status(self, request, queryset, status: str) -> None:
+        changed = queryset.transition_status(status)
+        self.message_user(
+            request,
+            f"{changed} orders moved to {dict(Order.STATUS_CHOICES)[status]}.",
+        )
+
+    @admin.action(description="Move waiting orders to preparation")
+    def move_to_preparation(self, request, queryset):
+        self.transition_status(request, queryset, "P")
+
+    @admin.action(description="Move orders in preparation to ready")
+    def move_to_ready(self, request, queryset):
+        self.transition_status(request, queryset, "R")
+
+    @admin.action(description="Move ready orders to delivered")
+    def move_to_delivered(self, request, queryset):
+        self.transition_status(request, queryset, "D")
 
 
 @admin.register(OrderDetail)
 class OrderDetailAdmin(admin.ModelAdmin):
     list_display = ("product", "order", "chosen_option")
+
+
+@admin.register(OrderStatusNotification)
+class OrderStatusNotificationAdmin(admin.ModelAdmin):
+    list_display = ("order", "status", "state", "attempts", "next_attempt_at")
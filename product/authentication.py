@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+
+from django.conf import settings
+
+from .throttling import ThrottledAuthenticationMixin
+
+
+class TokenUserCache:
+    """
+    Small in-process LRU cache of the users resolved from tokens, so a token is
+    looked up in the database at most once per timeout.
+
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> float:
+        return getattr(settings, "TOKEN_AUTHENTICATION_CACHE_TIMEOUT", 60)
+
+    @property
+    def max_size(self) -> int:
+        return getattr(settings, "TOKEN_AUTHENTICATION_CACHE_SIZE", 10000)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, credentials: tuple) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, credentials)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id: int) -> None:
+        with self._lock:
+            for key, (_, (user, _)) in list(self._entries.items()):
+                if user.pk == user_id:
+                    del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_user_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(ThrottledAuthenticationMixin, TokenAuthentication):
+    """
+    Token authentication resolving each token with a cheap lookup instead of
+    hashing a password on every request, with the resolved users cached in
+    process.
+
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = token_user_cache.get(key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            token_user_cache.set(key, credentials)
+        return credentials
+
+
+class ThrottledBasicAuthentication(ThrottledAuthenticationMixin, BasicAuthentication):
+    """
+    Basic authentication refusing clients out of failed authentications before
+    hashing the password they sent.
+
+    """
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from .models import Product, Order, OrderDetail
+
+
+@contextmanager
+def benchmark_database(verbosity: int = 0):
+    """
+    Runs the benchmark against a throwaway test database, so seeding it never
+    touches the configured data. Requests aren't throttled, as benchmarks send
+    far more of them than a client is allowed.
+
+    """
+    setup_test_environment()
+    old_config = setup_databases(
+        verbosity, interactive=False, aliases={"default"}, serialized_aliases=set()
+    )
+    try:
+        with override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}}
+        ):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity)
+        teardown_test_environment()
+
+
+def seed(users: int, products: int, orders: int, lines: int) -> list:
+    """
+    Seeds the database with users, products and orders of the given number of
+    order details, spread over every user.
+
+    :return list: users
+    """
+    User = get_user_model()
+    User.objects.bulk_create(
+        [User(username=f"benchmark{index}") for index in range(users)]
+    )
+    Product.objects.bulk_create(
+        [
+            Product(name=f"Product {index}", price=10000 + index)
+            for index in range(products)
+        ]
+    )
+    user_ids = list(
+        User.objects.filter(username__startswith="benchmark").values_list(
+            "id", flat=True
+        )
+    )
+    product_ids = list(Product.objects.values_list("id", flat=True))
+
+    created = Order.objects.bulk_create_with_ids(
+        [
+            Order(
+                user_id=user_ids[index % users],
+                status=Order.STATUS_CHOICES[index % 4][0],
+                total_price=10000 * lines,
+            )
+            for index in range(orders)
+        ]
+    )
+    OrderDetail.objects.bulk_create(
+        [
+            OrderDetail(
+                order_id=order.id,
+                product_id=product_ids[(order.id + line) % products],
+                unit_price=10000,
+            )
+            for order in created
+            for line in range(lines)
+        ],
+        batch_size=5000,
+    )
+    return list(User.objects.filter(id__in=user_ids))
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of the values.
+
+    :return float: percentile
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
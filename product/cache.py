@@ -0,0 +1,58 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOG_STATE_KEY = "product:catalog:state"
+
+
+def _new_catalog_state() -> dict:
+    return {"version": uuid.uuid4().hex, "last_modified": int(time.time())}
+
+
+def get_catalog_state() -> dict:
+    """
+    Returns the current catalog version and its last modification timestamp.
+
+    :return dict: state
+    """
+    state = cache.get(CATALOG_STATE_KEY)
+    if state is None:
+        # another process may have created the state in the meantime.
+        new_state = _new_catalog_state()
+        cache.add(CATALOG_STATE_KEY, new_state, timeout=None)
+        state = cache.get(CATALOG_STATE_KEY) or new_state
+    return state
+
+
+def invalidate_catalog() -> None:
+    """
+    Bumps the catalog version, so every cached payload of the previous version
+    is ignored and left to expire.
+
+    """
+    cache.set(CATALOG_STATE_KEY, _new_catalog_state(), timeout=None)
+
+
+def invalidate_catalog_on_commit() -> None:
+    """
+    Invalidates the catalog right away and once more after the transaction
+    commits, so payloads cached from uncommitted data are dropped as well.
+
+    """
+    invalidate_catalog()
+    transaction.on_commit(invalidate_catalog)
+
+
+def get_catalog_payload(state: dict, name: str):
+    return cache.get(f"product:catalog:{state['version']}:{name}")
+
+
+def set_catalog_payload(state: dict, name: str, payload) -> None:
+    cache.set(
+        f"product:catalog:{state['version']}:{name}",
+        payload,
+        timeout=getattr(settings, "PRODUCT_CATALOG_CACHE_TIMEOUT", 60 * 60),
+    )
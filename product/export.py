@@ -0,0 +1,100 @@
+import csv
+import json
+from itertools import groupby, islice
+
+from .models import OrderDetail
+
+CSV_HEADER = (
+    "order_id",
+    "status",
+    "total_price",
+    "product_id",
+    "product_name",
+    "unit_price",
+    "chosen_option",
+)
+
+
+def iter_orders(queryset, chunk_size: int = 2000):
+    """
+    Yields the orders of the queryset with their order details. The orders are
+    read in chunks and the order details of each chunk are fetched with a single
+    query, so memory stays bounded by the chunk size.
+
+    """
+    orders = (
+        queryset.order_by("id")
+        .values("id", "status", "total_price")
+        .iterator(chunk_size=chunk_size)
+    )
+    while chunk := list(islice(orders, chunk_size)):
+        order_details = (
+            OrderDetail.objects.filter(order_id__in=[order["id"] for order in chunk])
+            .order_by("order_id", "id")
+            .values(
+                "order_id", "product_id", "product__name", "unit_price", "chosen_option"
+            )
+        )
+        order_details = {
+            order_id: list(details)
+            for order_id, details in groupby(
+                order_details, key=lambda order_detail: order_detail["order_id"]
+            )
+        }
+        for order in chunk:
+            yield {
+                **order,
+                "order_details": [
+                    {
+                        "product": {
+                            "id": order_detail["product_id"],
+                            "name": order_detail["product__name"],
+                        },
+                        "unit_price": order_detail["unit_price"],
+                        "chosen_option": order_detail["chosen_option"],
+                    }
+                    for order_detail in order_details.get(order["id"], ())
+                ],
+            }
+
+
+def iter_ndjson(orders):
+    """
+    Yields one JSON line per order.
+
+    """
+    for order in orders:
+        yield json.dumps(order, ensure_ascii=False) + "\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(orders):
+    """
+    Yields the header and one CSV row per order detail.
+
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order in orders:
+        for order_detail in order["order_details"]:
+            yield writer.writerow(
+                (
+                    order["id"],
+                    order["status"],
+                    order["total_price"],
+                    order_detail["product"]["id"],
+                    order_detail["product"]["name"],
+                    order_detail["unit_price"],
+                    json.dumps(order_detail["chosen_option"], ensure_ascii=False),
+                )
+            )
+
+
+EXPORT_FORMATS = {
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+    "csv": (iter_csv, "text/csv"),
+}
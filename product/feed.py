@@ -0,0 +1,70 @@
+import threading
+import uuid
+from collections import deque
+
+from django.db import transaction
+
+
+class ChangeFeed:
+    """
+    In process feed of changed order ids, numbered by a sequence. Readers block
+    on a condition until something changes, so waiting costs no queries.
+
+    Cursors are "<epoch>:<sequence>", the epoch changing with every process, so
+    a cursor of another process or one older than the kept events asks the
+    reader to start over from a snapshot.
+
+    """
+
+    def __init__(self, size: int = 10000):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._events = deque(maxlen=size)
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    @property
+    def cursor(self) -> str:
+        with self._condition:
+            return f"{self.epoch}:{self._sequence}"
+
+    def publish(self, order_ids) -> None:
+        with self._condition:
+            for order_id in order_ids:
+                self._sequence += 1
+                self._events.append((self._sequence, order_id))
+            self._condition.notify_all()
+
+    def publish_on_commit(self, order_ids) -> None:
+        order_ids = list(order_ids)
+        transaction.on_commit(lambda: self.publish(order_ids))
+
+    def _parse(self, cursor: str):
+        epoch, _, sequence = (cursor or "").partition(":")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        oldest = self._events[0][0] if self._events else self._sequence + 1
+        if sequence > self._sequence or sequence < oldest - 1:
+            return None
+        return sequence
+
+    def wait(self, cursor: str, timeout: float):
+        """
+        Waits up to timeout seconds for changes after the cursor.
+
+        :return tuple: new cursor and changed order ids, or None as the ids when
+            the cursor can't be resumed
+        """
+        with self._condition:
+            if (since := self._parse(cursor)) is None:
+                return f"{self.epoch}:{self._sequence}", None
+            self._condition.wait_for(lambda: self._sequence > since, timeout)
+            order_ids = list(
+                dict.fromkeys(
+                    order_id for sequence, order_id in self._events if sequence > since
+                )
+            )
+            return f"{self.epoch}:{self._sequence}", order_ids
+
+
+order_feed = ChangeFeed()
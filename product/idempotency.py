@@ -0,0 +1,117 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+class IdempotencyKeyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this idempotency key is still in progress."
+    default_code = "idempotency_key_in_progress"
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This idempotency key was used with another request."
+    default_code = "idempotency_key_reused"
+
+
+def get_fingerprint(request) -> str:
+    body = json.dumps(request.data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(
+        f"{request.method} {request.path}\n{body}".encode()
+    ).hexdigest()
+
+
+def claim(user_id: int, key: str, fingerprint: str):
+    """
+    Claims the key for a new request, or returns the record of the request that
+    already claimed it. Records past their expiry are replaced.
+
+    :return tuple: record and whether it was claimed
+    """
+    expires_at = timezone.now() + timedelta(
+        seconds=getattr(settings, "IDEMPOTENCY_PROCESSING_TIMEOUT", 60)
+    )
+    for _ in range(2):
+        record = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+        if record is not None:
+            if record.expires_at > timezone.now():
+                return record, False
+            IdempotencyKey.objects.filter(
+                pk=record.pk, expires_at__lte=timezone.now()
+            ).delete()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user_id=user_id,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=expires_at,
+                )
+            return record, True
+        except IntegrityError:
+            # a concurrent request claimed it first.
+            continue
+    # the key was claimed and expired again in the meantime.
+    raise IdempotencyKeyInProgress()
+
+
+def idempotent(view):
+    """
+    Makes the view replay its response to retries carrying the same
+    Idempotency-Key header, without running it again. Retries arriving while
+    the first request is still running get a 409, and the key reused with
+    another request a 422. Failed requests release the key to be retried.
+
+    """
+
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return view(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            raise ValidationError({"Idempotency-Key": "The key is too long."})
+
+        fingerprint = get_fingerprint(request)
+        record, claimed = claim(request.user.id, key, fingerprint)
+        if not claimed:
+            if record.fingerprint != fingerprint:
+                raise IdempotencyKeyReused()
+            if record.state == "P":
+                raise IdempotencyKeyInProgress()
+            return Response(
+                record.response_body,
+                status=record.response_status,
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        try:
+            response = view(self, request, *args, **kwargs)
+        except BaseException:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            state="C",
+            response_status=response.status_code,
+            response_body=response.data,
+            expires_at=timezone.now()
+            + timedelta(seconds=getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 60 * 60)),
+        )
+        return response
+
+    return wrapper
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from product.models import Product, Order, OrderDetail
+
+
+class Command(BaseCommand):
+    help = (
+        "Captures the current product price on order details without a unit price "
+        "and recomputes the stored order totals in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of orders updated per transaction.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute the totals of every order, not only the backfilled ones.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["all"]:
+            order_ids = Order.objects.values_list("id", flat=True)
+        else:
+            order_ids = (
+                OrderDetail.objects.filter(unit_price__isnull=True)
+                .values_list("order_id", flat=True)
+                .distinct()
+            )
+        order_ids = sorted(order_ids)
+
+        unit_price = Subquery(
+            Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+        )
+        total_price = Coalesce(
+            Subquery(
+                OrderDetail.objects.filter(order_id=OuterRef("pk"))
+                .values("order_id")
+                .annotate(total=Sum("unit_price"))
+                .values("total")[:1]
+            ),
+            0,
+        )
+
+        details_count = orders_count = 0
+        for start in range(0, len(order_ids), batch_size):
+            end = start + batch_size
+            batch = order_ids[start:end]
+            with transaction.atomic():
+                details_count += OrderDetail.objects.filter(
+                    order_id__in=batch, unit_price__isnull=True
+                ).update(unit_price=unit_price)
+                orders_count += Order.objects.filter(id__in=batch).update(
+                    total_price=total_price
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfilled {details_count} order details "
+                f"and {orders_count} order totals."
+            )
+        )
@@ -0,0 +1,153 @@
+import json
+import platform
+import time
+import tracemalloc
+
+from rest_framework.test import APIClient
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from product.benchmark import benchmark_database, percentile, seed
+from product.models import Product, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database and reports latency percentiles, queries and "
+        "allocations per request of the product and order endpoints as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--products", type=int, default=30)
+        parser.add_argument("--orders", type=int, default=2000)
+        parser.add_argument(
+            "--lines", type=int, default=3, help="Number of order details per order."
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=100,
+            help="Number of timed requests per endpoint.",
+        )
+        parser.add_argument(
+            "--output", help="File the JSON results are written to, stdout otherwise."
+        )
+        parser.add_argument(
+            "--baseline", help="Results of a previous run to print the changes against."
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            users = seed(
+                options["users"],
+                options["products"],
+                options["orders"],
+                options["lines"],
+            )
+            client = APIClient()
+            client.force_authenticate(user=users[0])
+            product_id = Product.objects.values_list("id", flat=True).first()
+            order_id = (
+                Order.objects.filter(user=users[0]).values_list("id", flat=True).first()
+            )
+            order_data = {"order_details": [{"product": {"id": product_id}}]}
+
+            endpoints = {
+                "product-list": lambda: client.get(reverse("product-list")),
+                "product-detail": lambda: client.get(
+                    reverse("product-detail", kwargs={"pk": product_id})
+                ),
+                "order-list": lambda: client.get(reverse("order-list")),
+                "order-detail": lambda: client.get(
+                    reverse("order-detail", kwargs={"pk": order_id})
+                ),
+                "order-create": lambda: client.post(
+                    reverse("order-list"), data=order_data, format="json"
+                ),
+                "order-bulk": lambda: client.post(
+                    reverse("order-bulk"), data=[order_data] * 10, format="json"
+                ),
+            }
+            results = {
+                name: self.measure(request, options["requests"])
+                for name, request in endpoints.items()
+            }
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "options": {
+                name: options[name]
+                for name in ("users", "products", "orders", "lines", "requests")
+            },
+            "endpoints": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                self.compare(json.load(baseline)["endpoints"], results)
+
+    @staticmethod
+    def measure(request, requests: int) -> dict:
+        """
+        Sends the request repeatedly, timing it without tracing first and tracing
+        its allocations afterwards, so tracing doesn't skew the latencies.
+
+        :return dict: measurements
+        """
+        response = request()  # warm up caches and imports.
+        assert response.status_code < 400, response.content  # nosec
+
+        queries, latencies = [], []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            for _ in range(requests):
+                started = time.perf_counter()
+                request()
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        allocations = []
+        tracemalloc.start()
+        for _ in range(min(requests, 10)):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            request()
+            _, peak = tracemalloc.get_traced_memory()
+            allocations.append(peak - before)
+        tracemalloc.stop()
+
+        return {
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "queries_per_request": len(queries) / requests,
+            "peak_allocated_kib": round(percentile(allocations, 50) / 1024, 1),
+            "response_bytes": len(response.content),
+        }
+
+    def compare(self, baseline: dict, results: dict) -> None:
+        self.stderr.write(f"{'endpoint':>16} {'p50 ms':>16} {'queries':>14}")
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            previous = baseline[name]
+            self.stderr.write(
+                f"{name:>16} "
+                f"{previous['p50_ms']:>7.2f} -> {result['p50_ms']:<6.2f} "
+                f"{previous['queries_per_request']:>5.1f} -> "
+                f"{result['queries_per_request']:<5.1f}"
+            )
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rest_framework.authtoken.models import Token
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from product.benchmark import benchmark_database, seed
+from product.models import Product, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the concurrent request throughput of the sync views under WSGI, "
+        "the sync views under ASGI and the async views under ASGI, in process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument(
+            "--requests", type=int, default=400, help="Number of requests per run."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=16, help="Number of requests in flight."
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = seed(10, 20, options["orders"], 3)[0]
+            token = Token.objects.create(user=user).key
+            product_id = Product.objects.values_list("id", flat=True).first()
+            order_id = Order.objects.filter(user=user).values_list("id", flat=True)[0]
+
+            urls = {
+                "sync": (
+                    reverse("product-detail", kwargs={"pk": product_id}),
+                    reverse("order-detail", kwargs={"pk": order_id}),
+                ),
+                "async": (
+                    reverse("async-product-detail", kwargs={"pk": product_id}),
+                    reverse("async-order-detail", kwargs={"pk": order_id}),
+                ),
+            }
+            runs = (
+                ("wsgi", "sync", self.run_wsgi),
+                ("asgi", "sync", self.run_asgi),
+                ("asgi", "async", self.run_asgi),
+            )
+            self.stdout.write(f"{'server':>6} {'views':>6} {'requests/s':>11}")
+            for server, views, run in runs:
+                elapsed = run(urls[views], token, options)
+                self.stdout.write(
+                    f"{server:>6} {views:>6} {options['requests'] / elapsed:>11.0f}"
+                )
+
+    @staticmethod
+    def run_wsgi(urls: tuple, token: str, options: dict) -> float:
+        def send(index):
+            client = Client(HTTP_AUTHORIZATION=f"Token {token}")
+            response = client.get(urls[index % len(urls)])
+            assert response.status_code == 200  # nosec
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            list(executor.map(send, range(len(urls))))  # warm up
+            started = time.perf_counter()
+            list(executor.map(send, range(options["requests"])))
+            return time.perf_counter() - started
+
+    @staticmethod
+    def run_asgi(urls: tuple, token: str, options: dict) -> float:
+        async def run():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(options["concurrency"])
+
+            async def send(index):
+                async with semaphore:
+                    response = await client.get(
+                        urls[index % len(urls)], AUTHORIZATION=f"Token {token}"
+                    )
+                    assert response.status_code == 200  # nosec
+
+            await asyncio.gather(*(send(index) for index in range(len(urls))))
+            started = time.perf_counter()
+            await asyncio.gather(*(send(index) for index in range(options["requests"])))
+            return time.perf_counter() - started
+
+        return asyncio.run(run())
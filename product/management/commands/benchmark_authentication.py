@@ -0,0 +1,51 @@
+import base64
+import time
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from product.authentication import token_user_cache
+from product.benchmark import benchmark_database
+
+
+class Command(BaseCommand):
+    help = "Compares the per-request cost of basic and token authentication."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=50,
+            help="Number of requests sent with each authentication scheme.",
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = get_user_model().objects.create_user(
+                "benchmark", password="benchmark-password"  # nosec
+            )
+            token = Token.objects.create(user=user)
+            credentials = base64.b64encode(b"benchmark:benchmark-password").decode()
+            token_user_cache.clear()
+
+            schemes = (
+                ("basic", f"Basic {credentials}"),
+                ("token", f"Token {token.key}"),
+            )
+            self.stdout.write(f"{'scheme':>8} {'mean ms':>10} {'total s':>10}")
+            for scheme, authorization in schemes:
+                client = APIClient(HTTP_AUTHORIZATION=authorization)
+                started = time.perf_counter()
+                for _ in range(options["requests"]):
+                    response = client.get(reverse("order-list"))
+                    assert response.status_code == 200  # nosec
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{scheme:>8} "
+                    f"{elapsed / options['requests'] * 1000:>10.2f} "
+                    f"{elapsed:>10.2f}"
+                )
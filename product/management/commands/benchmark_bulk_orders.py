@@ -0,0 +1,72 @@
+import time
+
+from rest_framework.test import APIClient
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from product.benchmark import benchmark_database
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the throughput of creating orders one request at a time with "
+        "creating them through the bulk endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--orders", type=int, default=200, help="Number of orders created."
+        )
+        parser.add_argument(
+            "--lines", type=int, default=3, help="Number of order details per order."
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = get_user_model().objects.create_user("benchmark")
+            Product.objects.bulk_create(
+                [
+                    Product(name=f"Product {index}", price=10000)
+                    for index in range(options["lines"])
+                ]
+            )
+            product_ids = list(Product.objects.values_list("id", flat=True))
+            order_data = {
+                "order_details": [
+                    {"product": {"id": product_id}} for product_id in product_ids
+                ]
+            }
+            client = APIClient()
+            client.force_authenticate(user=user)
+            orders = options["orders"]
+
+            def single():
+                for _ in range(orders):
+                    response = client.post(
+                        reverse("order-list"), data=order_data, format="json"
+                    )
+                    assert response.status_code == 201  # nosec
+
+            def bulk():
+                response = client.post(
+                    reverse("order-bulk"), data=[order_data] * orders, format="json"
+                )
+                assert response.status_code == 201  # nosec
+
+            self.stdout.write(
+                f"{'path':>8} {'orders/s':>10} {'queries':>8} {'seconds':>8}"
+            )
+            for name, run in (("single", single), ("bulk", bulk)):
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    run()
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{name:>8} {orders / elapsed:>10.0f} "
+                    f"{len(context.captured_queries):>8} {elapsed:>8.2f}"
+                )
@@ -0,0 +1,94 @@
+import re
+
+from rest_framework.test import APIClient
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from product.benchmark import benchmark_database
+from product.models import Product, Order, OrderDetail
+
+WRITE_QUERY = re.compile(r"^\s*(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the writes of replacing every order detail (PUT) with adding a "
+        "single order detail (PATCH) on an order of the given size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lines",
+            type=int,
+            nargs="+",
+            default=[1, 10, 50, 200],
+            help="Number of order details of the benchmarked orders.",
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = get_user_model().objects.create_user("benchmark")
+            product = Product.objects.create(name="Latte", price=30000)
+            client = APIClient()
+            client.force_authenticate(user=user)
+
+            self.stdout.write(
+                f"{'lines':>6} {'strategy':>8} {'statements':>10} {'rows':>6}"
+            )
+            for lines in options["lines"]:
+                for strategy in ("replace", "diff"):
+                    order = Order.objects.create(user=user)
+                    OrderDetail.objects.bulk_create(
+                        [
+                            OrderDetail(order=order, product=product)
+                            for _ in range(lines)
+                        ]
+                    )
+                    statements, rows = self.add_one_line(
+                        client, order, product, strategy
+                    )
+                    self.stdout.write(
+                        f"{lines:>6} {strategy:>8} {statements:>10} {rows:>6}"
+                    )
+
+    @staticmethod
+    def add_one_line(client, order, product, strategy):
+        """
+        Adds one order detail with the given strategy.
+
+        :return tuple: write statements, inserted and deleted rows
+        """
+        url = reverse("order-detail", kwargs={"pk": order.pk})
+        old_ids = set(order.orderdetail_set.values_list("id", flat=True))
+        with CaptureQueriesContext(connection) as context:
+            if strategy == "replace":
+                response = client.put(
+                    url,
+                    data={
+                        "order_details": [{"product": {"id": product.id}}]
+                        * (len(old_ids) + 1)
+                    },
+                    format="json",
+                )
+            else:
+                response = client.patch(
+                    url,
+                    data=[
+                        {
+                            "action": "+",
+                            "order_details": [{"product": {"id": product.id}}],
+                        }
+                    ],
+                    format="json",
+                )
+        assert response.status_code == 200, response.data  # nosec
+
+        new_ids = set(order.orderdetail_set.values_list("id", flat=True))
+        statements = sum(
+            1 for query in context.captured_queries if WRITE_QUERY.match(query["sql"])
+        )
+        return statements, len(old_ids ^ new_ids)
@@ -0,0 +1,85 @@
+import time
+import uuid
+from functools import partial
+
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.throttling import UserRateThrottle
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from product.throttling import UserBucketThrottle
+
+
+class HistoryThrottle(UserRateThrottle):
+    """
+    Rest framework throttle keeping the timestamps of the requests in the window.
+
+    """
+
+    def __init__(self, rate: str):
+        self.rate = rate
+        super().__init__()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the per-request overhead of the cache bucket throttle with the "
+        "request history throttle of rest framework, at growing rates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rates",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000],
+            help="Requests per minute allowed by the benchmarked throttles.",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=2000,
+            help="Number of throttled requests timed for each rate.",
+        )
+
+    def handle(self, *args, **options):
+        request = Request(RequestFactory().get("/api/order/"))
+
+        self.stdout.write(f"{'rate/min':>9} {'throttle':>8} {'mean us':>9}")
+        for rate in options["rates"]:
+            with override_settings(
+                REST_FRAMEWORK={
+                    **api_settings.user_settings,
+                    "DEFAULT_THROTTLE_RATES": {"user_read": f"{rate}/min"},
+                }
+            ):
+                for name, make_throttle in (
+                    ("history", partial(HistoryThrottle, f"{rate}/min")),
+                    ("bucket", UserBucketThrottle),
+                ):
+                    # every run has its own buckets, leaving the rest of the cache alone.
+                    request.user = get_user_model()(pk=f"benchmark-{uuid.uuid4().hex}")
+                    mean = self.time_requests(
+                        make_throttle, request, rate, options["requests"]
+                    )
+                    self.stdout.write(f"{rate:>9} {name:>8} {mean * 1e6:>9.1f}")
+
+    @staticmethod
+    def time_requests(make_throttle, request, rate: int, requests: int) -> float:
+        """
+        Times the throttle once the client used up all but one request of the
+        window, where the history throttle keeps the longest history.
+
+        :return float: mean seconds per request
+        """
+        for _ in range(rate - 1):
+            make_throttle().allow_request(request, None)
+
+        started = time.perf_counter()
+        for _ in range(requests):
+            make_throttle().allow_request(request, None)
+        return (time.perf_counter() - started) / requests
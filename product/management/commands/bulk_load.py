@@ -0,0 +1,152 @@
+import json
+import time
+from collections import defaultdict
+
+from django.core import serializers
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from product.cache import invalidate_catalog_on_commit
+from product.models import Order, OrderDetail, OrderStatusNotification, Product
+from product.rollups import rebuild_rollups
+
+
+def iter_json_array(file, chunk_size: int = 1 << 16):
+    """
+    Yields the objects of a JSON array file without reading it into memory.
+
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, opened = "", 0, False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if not opened:
+                if buffer[position] != "[":
+                    raise CommandError("Fixture must be a JSON array of objects.")
+                opened, position = True, position + 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the object continues in the next chunk.
+                break
+            yield item
+        if not chunk:
+            raise CommandError("Fixture ended before the end of the JSON array.")
+
+
+def iter_json_lines(file):
+    """
+    Yields the object of each non empty line of a NDJSON file.
+
+    """
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads fixtures in the loaddata format (or NDJSON) with batched bulk "
+        "inserts instead of saving every object on its own."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fixtures", nargs="+", help="Fixture files to load.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of rows inserted per bulk insert.",
+        )
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="Backfill the order prices of rows loaded without them.",
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.pending = defaultdict(list)
+        self.pending_m2m = defaultdict(list)
+        self.counts = defaultdict(int)
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            # like loaddata, check the foreign keys once every row is in.
+            with connection.constraint_checks_disabled():
+                for fixture in options["fixtures"]:
+                    self.load(fixture)
+                self.flush()
+            models = list(self.counts)
+            connection.check_constraints(
+                table_names=[model._meta.db_table for model in models]
+            )
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+            # signals are skipped by the bulk inserts, run their side effects once.
+            if Product in self.counts:
+                invalidate_catalog_on_commit()
+        if options["backfill"]:
+            call_command("backfill_order_prices", stdout=self.stdout)
+        # the rollups add up the loaded orders once their prices are filled in.
+        if self.counts.keys() & {Order, OrderDetail, OrderStatusNotification}:
+            rebuild_rollups()
+        elapsed = time.perf_counter() - started
+
+        for model, count in self.counts.items():
+            self.stdout.write(f"{model._meta.label}: {count} rows")
+        total = sum(self.counts.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {total} rows in {elapsed:.2f}s "
+                f"({total / elapsed if elapsed else 0:.0f} rows/s)."
+            )
+        )
+
+    def load(self, fixture: str) -> None:
+        with open(fixture, encoding="utf-8") as file:
+            if fixture.endswith((".ndjson", ".jsonl")):
+                items = iter_json_lines(file)
+            else:
+                items = iter_json_array(file)
+            for deserialized in serializers.deserialize("python", items):
+                model = type(deserialized.object)
+                self.pending[model].append(deserialized.object)
+                for field_name, values in (deserialized.m2m_data or {}).items():
+                    field = model._meta.get_field(field_name)
+                    through = field.remote_field.through
+                    self.pending_m2m[through].extend(
+                        through(
+                            **{
+                                field.m2m_field_name(): deserialized.object,
+                                field.m2m_reverse_field_name() + "_id": value,
+                            }
+                        )
+                        for value in values
+                    )
+                if len(self.pending[model]) >= self.batch_size:
+                    self.flush(model)
+
+    def flush(self, model=None) -> None:
+        for pending_model in [model] if model else list(self.pending):
+            objects = self.pending.pop(pending_model, [])
+            pending_model._base_manager.bulk_create(objects, batch_size=self.batch_size)
+            self.counts[pending_model] += len(objects)
+        if model is None:
+            for through, objects in self.pending_m2m.items():
+                through._base_manager.bulk_create(objects, batch_size=self.batch_size)
+                self.counts[through] += len(objects)
+            self.pending_m2m.clear()
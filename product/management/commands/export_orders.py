@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from product.export import EXPORT_FORMATS, iter_orders
+from product.models import Order
+
+
+class Command(BaseCommand):
+    help = "Streams the order history as NDJSON or CSV with flat memory usage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=tuple(EXPORT_FORMATS), default="ndjson", dest="format"
+        )
+        parser.add_argument(
+            "--user", type=int, help="Only export the orders of this user id."
+        )
+        parser.add_argument(
+            "--output", help="File the orders are written to, stdout by default."
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of orders read from the database at a time.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Order.objects.all()
+        if options["user"] is not None:
+            queryset = queryset.filter(user_id=options["user"])
+        render, _ = EXPORT_FORMATS[options["format"]]
+        lines = render(iter_orders(queryset, chunk_size=options["chunk_size"]))
+
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
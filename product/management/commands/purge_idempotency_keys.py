@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from product.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Deletes the idempotency keys past their expiry."
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(
+            expires_at__lte=timezone.now()
+        ).delete()
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys.")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from product.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the hourly sales and order status rollups from the orders, "
+        "their details and their status changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rollup rows inserted per query.",
+        )
+
+    def handle(self, *args, **options):
+        sales, statuses = rebuild_rollups(batch_size=options["batch_size"])
+        self.stdout.write(
+            f"Rebuilt {sales} product sales and {statuses} order status buckets."
+        )
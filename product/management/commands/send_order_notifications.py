@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.outbox import send_pending_notifications
+
+
+class Command(BaseCommand):
+    help = "Sends the queued order status notification emails in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of emails sent over one connection.",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="Number of attempts before a notification is marked as failed.",
+        )
+        parser.add_argument(
+            "--backoff",
+            type=int,
+            default=60,
+            help="Seconds before the first retry, doubled on every attempt.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new notifications instead of exiting when drained.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait between polls when looping.",
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_pending_notifications(
+                batch_size=options["batch_size"],
+                max_attempts=options["max_attempts"],
+                backoff=options["backoff"],
+            )
+            total_sent += sent
+            total_failed += failed
+            if sent + failed:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {total_sent} notifications, {total_failed} failed."
+            )
+        )
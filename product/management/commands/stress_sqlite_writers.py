@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+
+from product.benchmark import benchmark_database, percentile
+from product.models import Product, Order
+from product.serializers import OrderSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent order writers against a temporary SQLite file database, "
+        "with the stock SQLite profile and the configured one, and reports the "
+        "writes failing with a locked database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--writers", type=int, default=8, help="Number of concurrent writers."
+        )
+        parser.add_argument(
+            "--orders", type=int, default=50, help="Orders created by each writer."
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("The stress test only runs against SQLite.")
+        self.stdout.write(
+            f"{'profile':>8} {'orders':>7} {'locked':>7} {'orders/s':>9} "
+            f"{'p50 ms':>7} {'p99 ms':>7}"
+        )
+        configured_options = connection.settings_dict["OPTIONS"]
+        for profile in ("default", "tuned"):
+            overrides = {}
+            if profile == "default":
+                # stock SQLite: deferred transactions and no pragmas.
+                connection.settings_dict["OPTIONS"] = {
+                    name: value
+                    for name, value in configured_options.items()
+                    if name != "transaction_mode"
+                }
+                overrides["SQLITE_PRAGMAS"] = {}
+            try:
+                with override_settings(**overrides):
+                    created, locked, elapsed, latencies = self.run_writers(
+                        options["writers"], options["orders"]
+                    )
+            finally:
+                connection.settings_dict["OPTIONS"] = configured_options
+            self.stdout.write(
+                f"{profile:>8} {created:>7} {locked:>7} {created / elapsed:>9.1f} "
+                f"{percentile(latencies, 50) * 1000:>7.1f} "
+                f"{percentile(latencies, 99) * 1000:>7.1f}"
+            )
+
+    def run_writers(self, writers: int, orders: int):
+        """
+        Creates the orders of every writer on its own thread and connection, then
+        moves each of them to preparation.
+
+        :return tuple: created orders, locked writes, elapsed seconds, latencies
+        """
+        directory = tempfile.mkdtemp()
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(
+            directory, "stress.sqlite3"
+        )
+        try:
+            with benchmark_database():
+                user = get_user_model().objects.create_user("stress")
+                product = Product.objects.create(name="Latte", price=30000)
+                # the writers open their own connections to the database file.
+                connection.close()
+
+                lock, results = threading.Lock(), {"locked": 0, "latencies": []}
+                threads = [
+                    threading.Thread(
+                        target=self.write_orders,
+                        args=(user.id, product.id, orders, lock, results),
+                    )
+                    for _ in range(writers)
+                ]
+                started = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+                created = Order.objects.filter(user_id=user.id).count()
+                connection.close()
+        finally:
+            connection.settings_dict["TEST"]["NAME"] = None
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+        return created, results["locked"], elapsed, results["latencies"] or [0]
+
+    @staticmethod
+    def write_orders(user_id: int, product_id: int, orders: int, lock, results):
+        data = {"order_details": [{"product": {"id": product_id}}]}
+        try:
+            for _ in range(orders):
+                started = time.perf_counter()
+                try:
+                    serializer = OrderSerializer(data=data)
+                    serializer.is_valid(raise_exception=True)
+                    order = serializer.save(user_id=user_id)
+                    Order.objects.filter(pk=order.pk).transition_status("P")
+                except OperationalError as error:
+                    if "locked" not in str(error):
+                        raise
+                    with lock:
+                        results["locked"] += 1
+                    continue
+                with lock:
+                    results["latencies"].append(time.perf_counter() - started)
+        finally:
+            connection.close()
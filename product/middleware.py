@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, Http404
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.view_started = None
+        self.view_db_time = 0.0
+        self.serialize_time = None
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+class MetricsRegistry:
+    """
+    In process aggregation of the request metrics, rendered in the Prometheus
+    text format.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters = defaultdict(float)
+            self._buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+            self._durations = defaultdict(float)
+
+    def observe(self, labels: tuple, duration: float, metrics, size: int, over: bool):
+        with self._lock:
+            self._counters["requests_total", labels] += 1
+            self._durations[labels] += duration
+            self._counters["db_queries_total", labels] += metrics.queries
+            self._counters["db_duration_seconds_sum", labels] += metrics.db_time
+            if metrics.serialize_time is not None:
+                self._counters[
+                    "serialize_duration_seconds_sum", labels
+                ] += metrics.serialize_time
+            self._counters["response_bytes_total", labels] += size
+            self._counters["query_budget_exceeded_total", labels] += over
+            buckets = self._buckets[labels]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            buckets = {labels: list(counts) for labels, counts in self._buckets.items()}
+            durations = dict(self._durations)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE restbucks_{name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"restbucks_{name}{{{self.labels(labels)}}} {value:g}")
+        lines.append("# TYPE restbucks_request_duration_seconds histogram")
+        for labels, counts in sorted(buckets.items()):
+            for bound, count in zip(DURATION_BUCKETS, counts):
+                lines.append(
+                    "restbucks_request_duration_seconds_bucket"
+                    f'{{{self.labels(labels)},le="{bound:g}"}} {count}'
+                )
+            total = counters["requests_total", labels]
+            lines.append(
+                "restbucks_request_duration_seconds_bucket"
+                f'{{{self.labels(labels)},le="+Inf"}} {total:g}'
+            )
+            lines.append(
+                "restbucks_request_duration_seconds_sum"
+                f"{{{self.labels(labels)}}} {durations[labels]:g}"
+            )
+            lines.append(
+                "restbucks_request_duration_seconds_count"
+                f"{{{self.labels(labels)}}} {total:g}"
+            )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def labels(labels: tuple) -> str:
+        view, method = labels
+        return f'view="{view}",method="{method}"'
+
+
+registry = MetricsRegistry()
+
+
+class InstrumentationMiddleware:
+    """
+    Records the wall time, database queries, serializer time and response size
+    of every request, exposes them in a Server-Timing header and aggregates them
+    for the metrics endpoint. Requests running more queries than
+    INSTRUMENTATION_QUERY_BUDGET are logged and flagged.
+
+    Serializer time is the view time spent outside the database, which is where
+    the DRF views of this project spend it.
+
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request._metrics = RequestMetrics()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics.record_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view = getattr(request.resolver_match, "view_name", None) or "unresolved"
+        size = 0 if response.streaming else len(response.content)
+        budget = getattr(settings, "INSTRUMENTATION_QUERY_BUDGET", 20)
+        over_budget = metrics.queries > budget
+        registry.observe((view, request.method), duration, metrics, size, over_budget)
+
+        timings = [
+            f"total;dur={duration * 1000:.2f}",
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+        ]
+        if metrics.serialize_time is not None:
+            timings.append(f"serialize;dur={metrics.serialize_time * 1000:.2f}")
+        response["Server-Timing"] = ", ".join(timings)
+        if over_budget:
+            response["X-Query-Budget-Exceeded"] = f"{metrics.queries}/{budget}"
+            logger.warning(
+                "%s %s ran %d queries, over the budget of %d.",
+                request.method,
+                request.path,
+                metrics.queries,
+                budget,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = request._metrics
+        metrics.view_started = time.perf_counter()
+        metrics.view_db_time = metrics.db_time
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this hook, so the view is done here.
+        metrics = request._metrics
+        if metrics.view_started is not None:
+            metrics.serialize_time = (time.perf_counter() - metrics.view_started) - (
+                metrics.db_time - metrics.view_db_time
+            )
+        return response
+
+
+def metrics_view(request):
+    """
+    Serves the aggregated request metrics in the Prometheus text format to local
+    clients when the instrumentation middleware is enabled.
+
+    """
+    local_addresses = {"127.0.0.1", "::1", *getattr(settings, "INTERNAL_IPS", ())}
+    if (
+        "product.middleware.InstrumentationMiddleware" not in settings.MIDDLEWARE
+        or request.META.get("REMOTE_ADDR") not in local_addresses
+    ):
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
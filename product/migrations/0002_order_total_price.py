@@ -0,0 +1,23 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="total_price",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="orderdetail",
+            name="unit_price",
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
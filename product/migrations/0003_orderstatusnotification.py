@@ -0,0 +1,69 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0002_order_total_price"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderStatusNotification",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("W", "Waiting"),
+                            ("P", "Preparation"),
+                            ("R", "Ready"),
+                            ("D", "Delivered"),
+                        ],
+                        max_length=1,
+                    ),
+                ),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[("P", "Pending"), ("S", "Sent"), ("F", "Failed")],
+                        default="P",
+                        max_length=1,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="product.order"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="orderstatusnotification",
+            index=models.Index(
+                fields=["state", "next_attempt_at"], name="product_ord_state_cfda97_idx"
+            ),
+        ),
+    ]
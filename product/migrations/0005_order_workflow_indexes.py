@@ -0,0 +1,31 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0004_order_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["status", "id"], name="order_status_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("status", "D"), _negated=True),
+                fields=["id"],
+                name="order_open_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="orderdetail",
+            index=models.Index(
+                fields=["order", "product"], name="orderdetail_order_product_idx"
+            ),
+        ),
+    ]
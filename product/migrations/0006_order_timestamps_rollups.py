@@ -0,0 +1,93 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0005_order_workflow_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderStatusRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("W", "Waiting"),
+                            ("P", "Preparation"),
+                            ("R", "Ready"),
+                            ("D", "Delivered"),
+                        ],
+                        max_length=1,
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name="ProductSalesRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField()),
+                ("quantity", models.IntegerField(default=0)),
+                ("revenue", models.BigIntegerField(default=0)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="product.product",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="orderstatusrollup",
+            constraint=models.UniqueConstraint(
+                fields=("hour", "status"), name="orderstatusrollup_hour_status"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productsalesrollup",
+            index=models.Index(fields=["hour"], name="productsalesrollup_hour_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="productsalesrollup",
+            constraint=models.UniqueConstraint(
+                fields=("product", "hour"), name="productsalesrollup_product_hour"
+            ),
+        ),
+    ]
@@ -1,5 +1,14 @@
-from django.db import models
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import IntegrityError, connections, models, transaction
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .feed import order_feed
+from .options import OptionSchema
 
 
 def get_default_product_options():
@@ -18,6 +27,102 @@ class Product(models.Model):
     def __str__(self) -> str:
         return self.name
 
+    def clean(self):
+        # options must compile, so the chosen options of orders can be checked.
+        try:
+            OptionSchema(self.options)
+        except ValidationError as error:
+            raise ValidationError({"options": error.messages})
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_details(self) -> "OrderQuerySet":
+        """
+        Prefetches order details with their products, so serializing the orders
+        takes a fixed number of queries.
+
+        :return OrderQuerySet: queryset
+        """
+        return self.prefetch_related(
+            models.Prefetch(
+                "orderdetail_set",
+                queryset=OrderDetail.objects.select_related("product"),
+            )
+        )
+
+    def bulk_create_with_ids(self, orders: list) -> list:
+        """
+        Bulk creates the orders and sets their primary keys, even on databases
+        that can't return them from a bulk insert.
+
+        :return list: orders
+        """
+        connection = connections[self.db]
+        if connection.features.can_return_rows_from_bulk_insert:
+            return self.bulk_create(orders)
+        if connection.vendor != "sqlite":
+            # one insert each, without the signals of save, as the callers record
+            # the orders like after any bulk insert.
+            fields = [
+                field
+                for field in self.model._meta.concrete_fields
+                if not isinstance(field, models.AutoField)
+            ]
+            returning_fields = self.model._meta.db_returning_fields
+            with transaction.atomic(using=self.db):
+                for order in orders:
+                    (row,) = self._insert(
+                        [order], fields, returning_fields, using=self.db
+                    )
+                    for value, field in zip(row, returning_fields):
+                        setattr(order, field.attname, value)
+                    order._state.adding = False
+                    order._state.db = self.db
+            return orders
+        with transaction.atomic(using=self.db):
+            self.bulk_create(orders)
+            # SQLite holds the write lock from the first insert until the commit,
+            # so the newest ids are the ones just inserted, in insertion order.
+            ids = list(
+                self.model._base_manager.using(self.db)
+                .order_by("-id")
+                .values_list("id", flat=True)[: len(orders)]
+            )
+            for order, order_id in zip(orders, reversed(ids)):
+                order.id = order_id
+        return orders
+
+    def transition_status(self, status: str) -> int:
+        """
+        Moves the orders one step forward in the W -> P -> R -> D workflow and
+        queues one status change notification per changed order. Orders not in
+        the previous status of the given one are left untouched.
+
+        :return int: number of changed orders
+        """
+        if (previous_status := Order.STATUS_TRANSITIONS.get(status)) is None:
+            raise ValueError(f'"{status}" is not a status orders can move to.')
+        with transaction.atomic():
+            order_ids = list(
+                self.select_for_update()
+                .filter(status=previous_status)
+                .values_list("id", flat=True)
+            )
+            if not order_ids:
+                return 0
+            Order.objects.filter(id__in=order_ids).update(
+                status=status, updated_at=timezone.now()
+            )
+            OrderStatusNotification.objects.bulk_create(
+                [
+                    OrderStatusNotification(order_id=order_id, status=status)
+                    for order_id in order_ids
+                ]
+            )
+            OrderStatusRollup.record(status, len(order_ids))
+            order_feed.publish_on_commit(order_ids)
+        return len(order_ids)
+
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -26,36 +131,274 @@ class Order(models.Model):
         ("R", "Ready"),
         ("D", "Delivered"),
     )
+    # the status each status can be reached from.
+    STATUS_TRANSITIONS = {"P": "W", "R": "P", "D": "R"}
 
     products = models.ManyToManyField(Product, through="product.OrderDetail")
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default="W")
+    # sum of the unit prices of the order details, maintained on every write.
+    total_price = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    # also set by the queryset updates of the status and the total price.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("user", "id"), name="order_user_id_idx"),
+            models.Index(fields=("user", "status"), name="order_user_status_idx"),
+            # the barista workflow scans orders by status.
+            models.Index(fields=("status", "id"), name="order_status_id_idx"),
+            # orders not delivered yet are a small, hot part of the table.
+            models.Index(
+                fields=("id",),
+                condition=~models.Q(status="D"),
+                name="order_open_idx",
+            ),
+        )
 
     def __str__(self) -> str:
         return f"{self.user}-{self.product_list()}"
 
-    def product_list(self) -> str:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the loaded values, so changes are detected without a query.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # status change notifications are queued by the signals in the same transaction.
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        self._loaded_values = {
+            **getattr(self, "_loaded_values", {}),
+            **{
+                field.attname: self.__dict__[field.attname]
+                for field in self._meta.concrete_fields
+                if field.attname in self.__dict__
+                and (
+                    update_fields is None
+                    or {field.name, field.attname} & set(update_fields)
+                )
+            },
+        }
+
+    def get_loaded_value(self, field_name: str):
         """
-        Returns a string of all product names seperated by comma.
+        Returns the value of the field as it was loaded from the database, only
+        querying it when the field wasn't loaded.
 
-        :return str: products
+        :return: value
         """
-        return ", ".join([product.name for product in self.products.all()])
+        loaded_values = getattr(self, "_loaded_values", {})
+        if field_name not in loaded_values:
+            loaded_values[field_name] = (
+                type(self)
+                ._base_manager.filter(pk=self.pk)
+                .values_list(field_name, flat=True)
+                .get()
+            )
+            self._loaded_values = loaded_values
+        return loaded_values[field_name]
 
-    @property
-    def total_price(self) -> int:
+    def product_list(self) -> str:
         """
-        Returns the total price of ordered products.
+        Returns a string of all product names seperated by comma.
 
-        :return int: total_price
+        :return str: products
         """
-        return self.products.aggregate(models.Sum("price")).get("price__sum")
+        return ", ".join([product.name for product in self.products.all()])
 
 
 class OrderDetail(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     chosen_option = models.JSONField(default=get_default_order_option)
+    # product price at the time of ordering, null for rows not backfilled yet.
+    unit_price = models.PositiveIntegerField(null=True)
+
+    class Meta:
+        indexes = (
+            # lets joins from orders to their products skip the detail rows.
+            models.Index(
+                fields=("order", "product"), name="orderdetail_order_product_idx"
+            ),
+        )
 
     def __str__(self):
         return f"{self.product}-{self.order.user}"
+
+
+class OrderStatusNotification(models.Model):
+    STATE_CHOICES = (
+        ("P", "Pending"),
+        ("S", "Sent"),
+        ("F", "Failed"),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    status = models.CharField(max_length=1, choices=Order.STATUS_CHOICES)
+    state = models.CharField(max_length=1, choices=STATE_CHOICES, default="P")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = (models.Index(fields=("state", "next_attempt_at")),)
+
+    def __str__(self) -> str:
+        return f"{self.order_id}-{self.get_status_display()}"
+
+
+def get_hour(moment: datetime = None) -> datetime:
+    """
+    Returns the start of the UTC hour of the moment, now by default.
+
+    :return datetime: hour
+    """
+    moment = timezone.localtime(moment or timezone.now(), dt_timezone.utc)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class RollupQuerySet(models.QuerySet):
+    def add(self, key: dict, **deltas) -> None:
+        """
+        Adds the deltas to the fields of the bucket of the key, creating it the
+        first time. A concurrent creation fails on the unique constraint, after
+        which the bucket exists to be added to.
+
+        """
+        increments = {name: models.F(name) + delta for name, delta in deltas.items()}
+        if self.filter(**key).update(**increments):
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(**key, **deltas)
+        except IntegrityError:
+            self.filter(**key).update(**increments)
+
+
+class ProductSalesRollup(models.Model):
+    """
+    Order details of a product and their revenue, by the hour their orders were
+    created in. Kept up to date by the order writes, see rollups.py.
+
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("product", "hour"), name="productsalesrollup_product_hour"
+            ),
+        )
+        indexes = (models.Index(fields=("hour",), name="productsalesrollup_hour_idx"),)
+
+    def __str__(self) -> str:
+        return f"{self.product}-{self.hour:%Y-%m-%d %H:00}"
+
+    @classmethod
+    def record(cls, order_details, created_at: datetime, sign: int = 1) -> None:
+        """
+        Adds the order details of an order created at the given moment, or
+        removes them with a sign of -1. Order details are objects or dicts with
+        a product_id and a unit_price.
+
+        """
+        hour, totals = get_hour(created_at), defaultdict(lambda: [0, 0])
+        for order_detail in order_details:
+            if isinstance(order_detail, dict):
+                product_id = order_detail["product_id"]
+                unit_price = order_detail["unit_price"]
+            else:
+                product_id = order_detail.product_id
+                unit_price = order_detail.unit_price
+            totals[product_id][0] += sign
+            totals[product_id][1] += sign * (unit_price or 0)
+        # a fixed order keeps concurrent writers from deadlocking on the buckets.
+        for product_id, (quantity, revenue) in sorted(totals.items()):
+            cls.objects.add(
+                {"product_id": product_id, "hour": hour},
+                quantity=quantity,
+                revenue=revenue,
+            )
+
+
+class OrderStatusRollup(models.Model):
+    """
+    Number of orders reaching each status, by the hour they reached it in.
+    Kept up to date by the order writes, which take deleted orders out again,
+    see rollups.py.
+
+    """
+
+    hour = models.DateTimeField()
+    status = models.CharField(max_length=1, choices=Order.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("hour", "status"), name="orderstatusrollup_hour_status"
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f"{self.get_status_display()}-{self.hour:%Y-%m-%d %H:00}"
+
+    @classmethod
+    def record(cls, status: str, count: int = 1, moment: datetime = None) -> None:
+        """
+        Counts orders reaching the status at the given moment, now by default.
+
+        """
+        if count:
+            cls.objects.add({"hour": get_hour(moment), "status": status}, count=count)
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a write request made with an Idempotency-Key header, replayed
+    to retries of the request, see idempotency.py.
+
+    """
+
+    STATE_CHOICES = (
+        ("P", "Processing"),
+        ("C", "Completed"),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # hash of the method, path and body the key was first used with.
+    fingerprint = models.CharField(max_length=64)
+    state = models.CharField(max_length=1, choices=STATE_CHOICES, default="P")
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "key"), name="idempotencykey_user_key"
+            ),
+        )
+        indexes = (models.Index(fields=("expires_at",)),)
+
+    def __str__(self) -> str:
+        return f"{self.user_id}-{self.key}"
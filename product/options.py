@@ -0,0 +1,121 @@
+import threading
+
+from django.core.exceptions import ValidationError
+
+from .cache import get_catalog_state
+
+CHOSEN_OPTION_TYPE_ERROR = "Chosen option must be an object of option names to indexes."
+
+
+class OptionSchema:
+    """
+    Product options compiled once into a mapping of option names to their
+    choices, so chosen options are checked and resolved with lookups only.
+
+    """
+
+    __slots__ = ("choices",)
+
+    def __init__(self, options):
+        if not isinstance(options, dict):
+            raise ValidationError(
+                "Options must be an object of option names to choices."
+            )
+        for name, choices in options.items():
+            if (
+                not isinstance(choices, list)
+                or not choices
+                or not all(isinstance(choice, str) for choice in choices)
+            ):
+                raise ValidationError(
+                    f'Choices of "{name}" must be a non empty list of strings.'
+                )
+        self.choices = {name: tuple(choices) for name, choices in options.items()}
+
+    def validate(self, chosen_option) -> list:
+        """
+        Checks every chosen option index against the choices.
+
+        :return list: errors
+        """
+        if not isinstance(chosen_option, dict):
+            return [CHOSEN_OPTION_TYPE_ERROR]
+        errors = []
+        for name, index in chosen_option.items():
+            if (choices := self.choices.get(name)) is None:
+                errors.append(f'"{name}" is not an option of this product.')
+            elif (
+                not isinstance(index, int)
+                or isinstance(index, bool)
+                or not 0 <= index < len(choices)
+            ):
+                errors.append(f'{index!r} is not a valid choice for "{name}".')
+        return errors
+
+    def resolve(self, chosen_option: dict) -> dict:
+        """
+        Replaces the chosen indexes with their choices, leaving None for the ones
+        the product doesn't offer anymore.
+
+        :return dict: chosen choices
+        """
+        resolved = {}
+        for name, index in chosen_option.items():
+            choices = self.choices.get(name, ())
+            resolved[name] = (
+                choices[index]
+                if isinstance(index, int) and 0 <= index < len(choices)
+                else None
+            )
+        return resolved
+
+
+class OptionSchemaCache:
+    """
+    In process cache of compiled option schemas by product id. Entries are
+    tagged with the catalog version, so a product change in any process
+    recompiles them.
+
+    """
+
+    def __init__(self):
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def get_cached(self, product_id: int, version: str):
+        """
+        Returns the compiled schema of the product cached for the catalog version.
+
+        :return OptionSchema: schema or None
+        """
+        entry = self._schemas.get(product_id)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        return None
+
+    def get(self, product_id: int, options, version: str = None) -> OptionSchema:
+        """
+        Returns the compiled schema of the product, compiling the given options
+        when it isn't cached for the catalog version.
+
+        :return OptionSchema: schema
+        """
+        if version is None:
+            version = get_catalog_state()["version"]
+        if (schema := self.get_cached(product_id, version)) is not None:
+            return schema
+        schema = OptionSchema(options)
+        with self._lock:
+            self._schemas[product_id] = (version, schema)
+        return schema
+
+    def delete(self, product_id: int) -> None:
+        with self._lock:
+            self._schemas.pop(product_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._schemas.clear()
+
+
+option_schemas = OptionSchemaCache()
@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OrderStatusNotification
+
+
+STATUS_CHANGED_NOTIFICATION_EMAIL_TEMPLATE = (
+    "Dear {},\n\nYour order {} status has changed to {}."
+)
+
+
+def get_notification_email(notification: OrderStatusNotification) -> EmailMessage:
+    """
+    Renders the status changed email of the notification.
+
+    :return EmailMessage: email
+    """
+    user = notification.order.user
+    return EmailMessage(
+        subject="Order status changed",
+        body=STATUS_CHANGED_NOTIFICATION_EMAIL_TEMPLATE.format(
+            user.first_name or user.username,
+            notification.order_id,
+            notification.get_status_display(),
+        ),
+        to=(user.email,),
+    )
+
+
+def send_pending_notifications(
+    batch_size: int = 100, max_attempts: int = 5, backoff: int = 60, lease: int = 300
+) -> tuple:
+    """
+    Sends a batch of due notifications over a single email connection. Failed
+    notifications are retried with an exponential backoff until they run out of
+    attempts.
+
+    The batch is claimed and its results recorded in two short transactions, so
+    a slow mail server doesn't hold the database lock while sending. Claimed
+    notifications aren't due again until the lease runs out, which returns them
+    to the queue if the worker dies while sending.
+
+    :return tuple: sent and failed notification counts
+    """
+    sent = failed = 0
+    with transaction.atomic():
+        notifications = list(
+            OrderStatusNotification.objects.select_for_update(skip_locked=True)
+            .filter(state="P", next_attempt_at__lte=timezone.now())
+            .select_related("order__user")
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        if not notifications:
+            return sent, failed
+        OrderStatusNotification.objects.filter(
+            pk__in=[notification.pk for notification in notifications]
+        ).update(next_attempt_at=timezone.now() + timedelta(seconds=lease))
+
+    def record_failure(notification, error):
+        notification.last_error = repr(error)
+        if notification.attempts >= max_attempts:
+            notification.state = "F"
+        else:
+            notification.next_attempt_at = timezone.now() + timedelta(
+                seconds=backoff * 2 ** (notification.attempts - 1)
+            )
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as error:  # noqa: B902
+        # the mail server is unreachable, every notification of the batch failed.
+        for notification in notifications:
+            notification.attempts += 1
+            record_failure(notification, error)
+        failed = len(notifications)
+    else:
+        with connection:
+            for notification in notifications:
+                notification.attempts += 1
+                try:
+                    connection.send_messages([get_notification_email(notification)])
+                except Exception as error:  # noqa: B902
+                    failed += 1
+                    record_failure(notification, error)
+                else:
+                    sent += 1
+                    notification.state = "S"
+                    notification.sent_at = timezone.now()
+
+    with transaction.atomic():
+        OrderStatusNotification.objects.bulk_update(
+            notifications,
+            ("state", "attempts", "next_attempt_at", "last_error", "sent_at"),
+        )
+    return sent, failed
@@ -0,0 +1,74 @@
+from rest_framework.pagination import CursorPagination
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using: str):
+    """
+    Returns the row count of the model table as estimated by the database
+    statistics, or None when the database has no estimate.
+
+    :return int: row count
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [table],
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # the first number of the table or index statistics is its row count,
+            # smaller for partial indexes, so the table count is the largest.
+            cursor.execute(
+                "SELECT MAX(CAST(substr(stat, 1, instr(stat || ' ', ' ') - 1) "
+                "AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s",
+                [table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    count = int(str(row[0]).split()[0])
+    return count if count >= 0 else None
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key, so fetching a page costs the same no
+    matter how deep into the list it is.
+
+    """
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+
+    @property
+    def max_page_size(self) -> int:
+        return getattr(settings, "API_MAX_PAGE_SIZE", 100)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using the estimated row count of large unfiltered tables instead of
+    a COUNT(*) over the whole table.
+
+    """
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            threshold = getattr(settings, "ESTIMATED_COUNT_THRESHOLD", 100000)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+        return super().count
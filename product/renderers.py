@@ -0,0 +1,61 @@
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders compact JSON with orjson, giving the same bytes as the JSON renderer
+    of rest framework. Indented output falls back to the rest framework renderer.
+
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        # types orjson would render differently go through the rest framework encoder.
+        rendered = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+        # escaped by rest framework, as they aren't valid in javascript strings.
+        return rendered.replace("\u2028".encode(), b"\\u2028").replace(
+            "\u2029".encode(), b"\\u2029"
+        )
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Renders the data as a single server sent event, so views streaming events
+    can be negotiated, and their errors reach event stream clients.
+
+    """
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    @staticmethod
+    def render_event(data, event: str = None, event_id: str = None) -> bytes:
+        """
+        Formats the data as a server sent event of JSON.
+
+        :return bytes: event
+        """
+        lines = []
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        if event is not None:
+            lines.append(f"event: {event}")
+        lines.append(f"data: {JSONRenderer().render(data).decode()}")
+        return ("\n".join(lines) + "\n\n").encode()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get("response")
+        event = "error" if response is not None and response.exception else None
+        return self.render_event(data, event=event)
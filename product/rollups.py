@@ -0,0 +1,76 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+
+from .models import (
+    Order,
+    OrderDetail,
+    OrderStatusNotification,
+    OrderStatusRollup,
+    ProductSalesRollup,
+)
+
+
+def rebuild_rollups(batch_size: int = 1000) -> tuple:
+    """
+    Recomputes both rollups from the orders, their details and their status
+    changes, with one aggregate query and one bulk insert for each.
+
+    :return tuple: number of sales and status buckets
+    """
+    utc = dt_timezone.utc
+    with transaction.atomic():
+        # the deletes take the write lock first, so no order is written between
+        # the aggregates and the inserts.
+        ProductSalesRollup.objects.all().delete()
+        OrderStatusRollup.objects.all().delete()
+        sales = list(
+            OrderDetail.objects.annotate(
+                hour=TruncHour("order__created_at", tzinfo=utc)
+            )
+            .values("product_id", "hour")
+            .annotate(quantity=Count("id"), revenue=Sum("unit_price"))
+            .order_by()
+        )
+        statuses = defaultdict(int)
+        for row in (
+            Order.objects.annotate(hour=TruncHour("created_at", tzinfo=utc))
+            .values("hour")
+            .annotate(count=Count("id"))
+            .order_by()
+        ):
+            statuses[row["hour"], "W"] += row["count"]
+        # every later status change is recorded by its notification.
+        for row in (
+            OrderStatusNotification.objects.annotate(
+                hour=TruncHour("created_at", tzinfo=utc)
+            )
+            .values("hour", "status")
+            .annotate(count=Count("id"))
+            .order_by()
+        ):
+            statuses[row["hour"], row["status"]] += row["count"]
+
+        sales_rollups = ProductSalesRollup.objects.bulk_create(
+            [
+                ProductSalesRollup(
+                    product_id=row["product_id"],
+                    hour=row["hour"],
+                    quantity=row["quantity"],
+                    revenue=row["revenue"] or 0,
+                )
+                for row in sales
+            ],
+            batch_size=batch_size,
+        )
+        status_rollups = OrderStatusRollup.objects.bulk_create(
+            [
+                OrderStatusRollup(hour=hour, status=status, count=count)
+                for (hour, status), count in statuses.items()
+            ],
+            batch_size=batch_size,
+        )
+    return len(sales_rollups), len(status_rollups)
@@ -1,18 +1,47 @@
+from collections import defaultdict
+from datetime import timedelta
+
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from django.core.validators import ValidationError as DjangoValidationError
+from django.db.models import F
 from django.db.utils import IntegrityError
+from django.utils import timezone
 
-from .models import Product, Order, OrderDetail, get_default_order_option
+from .cache import get_catalog_state
+from .feed import order_feed
+from .models import (
+    Product,
+    Order,
+    OrderDetail,
+    OrderStatusRollup,
+    ProductSalesRollup,
+    get_default_order_option,
+    get_hour,
+)
+from .options import CHOSEN_OPTION_TYPE_ERROR, OptionSchema, option_schemas
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    # fields of the rows fast_data is built from.
+    fast_fields = ("id", "name", "price", "options")
+
     class Meta:
         model = Product
         fields = ("id", "name", "price", "options")
 
+    @classmethod
+    def fast_data(cls, rows: list) -> list:
+        """
+        Returns the representation of the products built straight from rows of
+        their fast fields, the same the serializer gives for the instances.
+
+        :return list: products
+        """
+        return [{field: row[field] for field in cls.Meta.fields} for row in rows]
+
 
 class ProductMainDetailsSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
@@ -23,22 +52,196 @@ class ProductMainDetailsSerializer(serializers.ModelSerializer):
         read_only_fields = ("name", "price")
 
 
+def get_option_schemas(product_ids, version: str) -> dict:
+    """
+    Returns the compiled option schemas of the products for the catalog version,
+    None for products with invalid options. The options of the products missing
+    from the cache are fetched with a single query, from the primary like every
+    product read, as the replicas may lag behind the version.
+
+    :return dict: schemas by product id
+    """
+    schemas, missing = {}, set()
+    for product_id in product_ids:
+        if (schema := option_schemas.get_cached(product_id, version)) is not None:
+            schemas[product_id] = schema
+        else:
+            missing.add(product_id)
+    if missing:
+        for product_id, options in Product.objects.filter(id__in=missing).values_list(
+            "id", "options"
+        ):
+            try:
+                schemas[product_id] = option_schemas.get(product_id, options, version)
+            except DjangoValidationError:
+                schemas[product_id] = None
+    return schemas
+
+
 class OrderDetailSerializer(serializers.ModelSerializer):
     product = ProductMainDetailsSerializer()
-    # TODO: replace chosen_option index with the actual string value.
+    resolved_option = serializers.SerializerMethodField()
 
     class Meta:
         model = OrderDetail
-        fields = ("product", "chosen_option")
+        fields = ("product", "chosen_option", "resolved_option")
+
+    def get_resolved_option(self, instance: OrderDetail):
+        # the schemas are only cached under a catalog_version of the context read
+        # before the products were, as the products may be older than the version
+        # read now.
+        if (version := self.context.get("catalog_version")) is not None:
+            schema = get_option_schemas([instance.product_id], version).get(
+                instance.product_id
+            )
+        else:
+            schema = option_schemas.get_cached(
+                instance.product_id, get_catalog_state()["version"]
+            )
+            if schema is None:
+                try:
+                    schema = OptionSchema(instance.product.options)
+                except DjangoValidationError:
+                    return None
+        return schema.resolve(instance.chosen_option) if schema is not None else None
+
+
+class OrderDetailChangeSerializer(serializers.Serializer):
+    ACTION_CHOICES = (
+        ("+", "Add"),
+        ("-", "Remove"),
+    )
+
+    action = serializers.ChoiceField(choices=ACTION_CHOICES)
+    order_details = OrderDetailSerializer(many=True, allow_empty=False)
 
 
 class OrderSerializer(serializers.ModelSerializer):
     order_details = OrderDetailSerializer(many=True, source="orderdetail_set")
+    # fields of the rows fast_data is built from.
+    fast_fields = ("id", "status", "total_price")
 
     class Meta:
         model = Order
         fields = ("id", "order_details", "status", "total_price")
-        read_only_fields = ("status",)
+        read_only_fields = ("status", "total_price")
+
+    @classmethod
+    def fast_data(cls, rows: list) -> list:
+        """
+        Returns the representation of the orders built straight from rows of
+        their fast fields, the same the serializer gives for the instances. The
+        order details of all the orders are fetched with a single query.
+
+        :return list: orders
+        """
+        order_details = {row["id"]: [] for row in rows}
+        version = get_catalog_state()["version"]
+        details = list(
+            OrderDetail.objects.filter(order_id__in=order_details)
+            .order_by("id")
+            .values(
+                "order_id",
+                "product_id",
+                "product__name",
+                "product__price",
+                "chosen_option",
+            )
+        )
+        schemas = get_option_schemas(
+            {order_detail["product_id"] for order_detail in details}, version
+        )
+        for order_detail in details:
+            product_id = order_detail["product_id"]
+            schema = schemas.get(product_id)
+            chosen_option = order_detail["chosen_option"]
+            order_details[order_detail["order_id"]].append(
+                {
+                    "product": {
+                        "id": product_id,
+                        "name": order_detail["product__name"],
+                        "price": order_detail["product__price"],
+                    },
+                    "chosen_option": chosen_option,
+                    "resolved_option": schema.resolve(chosen_option)
+                    if schema is not None
+                    else None,
+                }
+            )
+        return [
+            {
+                "id": row["id"],
+                "order_details": order_details[row["id"]],
+                "status": row["status"],
+                "total_price": row["total_price"],
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def get_products(orders_details_data: list) -> dict:
+        """
+        Fetches every product referenced by the given lists of order details with
+        a single query.
+
+        :return dict: products by id
+        """
+        product_ids = {
+            order_detail["product"].get("id")
+            for order_details_data in orders_details_data
+            for order_detail in order_details_data
+        }
+        return {
+            product["id"]: product
+            for product in Product.objects.filter(id__in=product_ids).values(
+                "id", "price", "options"
+            )
+        }
+
+    @classmethod
+    def get_order_details(
+        cls, order_details_data: list, products: dict = None, version: str = None
+    ) -> list:
+        """
+        Builds unsaved order details with the current product prices captured as
+        their unit prices. All referenced products are fetched with a single query
+        unless they are given, along with the catalog version read before them,
+        and every invalid order detail is reported at once.
+
+        :return list: order_details
+        """
+        if products is None:
+            version = get_catalog_state()["version"]
+            products = cls.get_products([order_details_data])
+
+        order_details, errors = [], []
+        for order_detail in order_details_data:
+            product_id = order_detail["product"].get("id")
+            chosen_option = order_detail.get("chosen_option") or {}
+            if (product := products.get(product_id)) is None:
+                errors.append(
+                    {"product": {"id": [f"Product {product_id} does not exist."]}}
+                )
+                continue
+            try:
+                schema = option_schemas.get(product_id, product["options"], version)
+            except DjangoValidationError as error:
+                errors.append({"chosen_option": error.messages})
+                continue
+            if option_errors := schema.validate(chosen_option):
+                errors.append({"chosen_option": option_errors})
+                continue
+            errors.append({})
+            order_details.append(
+                OrderDetail(
+                    product_id=product_id,
+                    unit_price=product["price"],
+                    chosen_option={**get_default_order_option(), **chosen_option},
+                )
+            )
+        if any(errors):
+            raise ValidationError({"order_details": errors})
+        return order_details
 
     def create(self, validated_data: dict) -> Order:
         """
@@ -48,30 +251,86 @@ class OrderSerializer(serializers.ModelSerializer):
         order_details_data = validated_data.pop("orderdetail_set")
         if not order_details_data:
             raise ValidationError({"order_details": "Order details can't be empty"})
+        order_details = self.get_order_details(order_details_data)
         try:
             with transaction.atomic():
-                instance = Order.objects.create(**validated_data)
-                # Create and validate Product Order
-                order_details = [
-                    OrderDetail(
-                        product_id=order_detail["product"].get("id"),
-                        order_id=instance.id,
-                        chosen_option={**get_default_order_option(), **chosen_option}
-                        if (chosen_option := order_detail.get("chosen_option"))
-                        else get_default_order_option(),
-                    )
-                    for order_detail in order_details_data
-                ]
+                instance = Order.objects.create(
+                    **validated_data,
+                    total_price=sum(detail.unit_price for detail in order_details),
+                )
                 for order_detail in order_details:
-                    order_detail.full_clean()
+                    order_detail.order_id = instance.id
                 # add the list of products to ProductOrder
                 OrderDetail.objects.bulk_create(order_details)
-        except (IntegrityError, DjangoValidationError):
+                ProductSalesRollup.record(order_details, instance.created_at)
+        except IntegrityError:
             raise ValidationError(
                 {"order_details": "Some of the product ids are not valid."}
             )
         return instance
 
+    @classmethod
+    def bulk_create(cls, orders_data: list, **kwargs) -> list:
+        """
+        Creates the valid orders with one query for the products and one bulk
+        insert for each table.
+
+        :return list: created order or validation errors of each order
+        """
+        version = get_catalog_state()["version"]
+        products = cls.get_products(
+            [order_data["orderdetail_set"] for order_data in orders_data]
+        )
+        results, orders, orders_details = [], [], []
+        for order_data in orders_data:
+            order_data = dict(order_data)
+            order_details_data = order_data.pop("orderdetail_set")
+            try:
+                if not order_details_data:
+                    raise ValidationError(
+                        {"order_details": "Order details can't be empty"}
+                    )
+                order_details = cls.get_order_details(
+                    order_details_data, products, version
+                )
+            except ValidationError as error:
+                results.append(error.detail)
+                continue
+            order = Order(
+                **order_data,
+                **kwargs,
+                total_price=sum(detail.unit_price for detail in order_details),
+            )
+            results.append(order)
+            orders.append(order)
+            orders_details.append(order_details)
+
+        try:
+            with transaction.atomic():
+                Order.objects.bulk_create_with_ids(orders)
+                for order, order_details in zip(orders, orders_details):
+                    for order_detail in order_details:
+                        order_detail.order_id = order.id
+                OrderDetail.objects.bulk_create(
+                    [
+                        order_detail
+                        for order_details in orders_details
+                        for order_detail in order_details
+                    ]
+                )
+                orders_by_hour = defaultdict(list)
+                for order, order_details in zip(orders, orders_details):
+                    orders_by_hour[get_hour(order.created_at)].extend(order_details)
+                for hour, order_details in orders_by_hour.items():
+                    ProductSalesRollup.record(order_details, hour)
+                OrderStatusRollup.record("W", len(orders))
+                order_feed.publish_on_commit([order.id for order in orders])
+        except IntegrityError:
+            raise ValidationError(
+                {"order_details": "Some of the product ids are not valid."}
+            )
+        return results
+
     def update(self, instance: Order, validated_data: dict) -> Order:
         """
         Deletes all products from order and adds the given products instead.
@@ -80,27 +339,150 @@ class OrderSerializer(serializers.ModelSerializer):
         order_details_data = validated_data.pop("orderdetail_set")
         if not order_details_data:
             raise ValidationError({"order_details": "Order details can't be empty"})
+        order_details = self.get_order_details(order_details_data)
         try:
             with transaction.atomic():
                 # delete all the orders and replace with the new ones.
-                OrderDetail.objects.filter(order_id=instance.id).delete()
-                # Create and validate Product Order
-                order_details = [
-                    OrderDetail(
-                        product_id=order_detail["product"].get("id"),
-                        order_id=instance.id,
-                        chosen_option={**get_default_order_option(), **chosen_option}
-                        if (chosen_option := order_detail.get("chosen_option"))
-                        else get_default_order_option(),
-                    )
-                    for order_detail in order_details_data
-                ]
+                existing_order_details = OrderDetail.objects.filter(
+                    order_id=instance.id
+                )
+                ProductSalesRollup.record(
+                    existing_order_details.values("product_id", "unit_price"),
+                    instance.created_at,
+                    sign=-1,
+                )
+                existing_order_details.delete()
                 for order_detail in order_details:
-                    order_detail.full_clean()
+                    order_detail.order_id = instance.id
                 # add the list of products to ProductOrder
                 OrderDetail.objects.bulk_create(order_details)
-        except (IntegrityError, DjangoValidationError):
+                ProductSalesRollup.record(order_details, instance.created_at)
+                # update the total price without going through the save signals.
+                instance.total_price = sum(
+                    detail.unit_price for detail in order_details
+                )
+                instance.updated_at = timezone.now()
+                Order.objects.filter(pk=instance.pk).update(
+                    total_price=instance.total_price, updated_at=instance.updated_at
+                )
+                order_feed.publish_on_commit([instance.id])
+        except IntegrityError:
             raise ValidationError(
                 {"order_details": "Some of the product ids are not valid."}
             )
         return instance
+
+    def change(self, instance: Order, changes: list) -> Order:
+        """
+        Adds the order details of "+" changes and removes the matching existing
+        order details of "-" changes, leaving the other order details untouched.
+
+        """
+        additions, removals = [], []
+        for change in changes:
+            if change["action"] == "+":
+                additions.extend(change["order_details"])
+            else:
+                removals.extend(change["order_details"])
+        order_details = self.get_order_details(additions) if additions else []
+
+        with transaction.atomic():
+            existing_order_details = list(
+                OrderDetail.objects.select_for_update()
+                .filter(order_id=instance.id)
+                .values("id", "product_id", "chosen_option", "unit_price")
+            )
+            removed_ids, removed_price, errors = set(), 0, []
+            for order_detail in removals:
+                product_id = order_detail["product"].get("id")
+                chosen_option = order_detail.get("chosen_option") or {}
+                if not isinstance(chosen_option, dict):
+                    errors.append({"chosen_option": [CHOSEN_OPTION_TYPE_ERROR]})
+                    continue
+                chosen_option = {**get_default_order_option(), **chosen_option}
+                match = next(
+                    (
+                        existing
+                        for existing in existing_order_details
+                        if existing["id"] not in removed_ids
+                        and existing["product_id"] == product_id
+                        and existing["chosen_option"] == chosen_option
+                    ),
+                    None,
+                )
+                if match is None:
+                    errors.append(
+                        {"product": {"id": [f"Product {product_id} is not in order."]}}
+                    )
+                    continue
+                errors.append({})
+                removed_ids.add(match["id"])
+                removed_price += match["unit_price"] or 0
+            if any(errors):
+                raise ValidationError({"order_details": errors})
+            if len(existing_order_details) - len(removed_ids) + len(order_details) < 1:
+                raise ValidationError({"order_details": "Order details can't be empty"})
+
+            if removed_ids:
+                OrderDetail.objects.filter(id__in=removed_ids).delete()
+            if order_details:
+                for order_detail in order_details:
+                    order_detail.order_id = instance.id
+                OrderDetail.objects.bulk_create(order_details)
+            ProductSalesRollup.record(
+                [
+                    existing
+                    for existing in existing_order_details
+                    if existing["id"] in removed_ids
+                ],
+                instance.created_at,
+                sign=-1,
+            )
+            ProductSalesRollup.record(order_details, instance.created_at)
+            # update the total price without going through the save signals,
+            # relative to the stored one, as the instance was read before the
+            # transaction and concurrent changes may have moved it since.
+            instance.updated_at = timezone.now()
+            Order.objects.filter(pk=instance.pk).update(
+                total_price=F("total_price")
+                + sum(detail.unit_price for detail in order_details)
+                - removed_price,
+                updated_at=instance.updated_at,
+            )
+            instance.total_price = Order.objects.values_list(
+                "total_price", flat=True
+            ).get(pk=instance.pk)
+            order_feed.publish_on_commit([instance.id])
+        return instance
+
+
+class QueueOrderSerializer(OrderSerializer):
+    user = serializers.StringRelatedField()
+
+    class Meta(OrderSerializer.Meta):
+        fields = ("id", "user", "order_details", "status", "total_price")
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    product = serializers.IntegerField(required=False)
+
+    def validate(self, attrs: dict) -> dict:
+        attrs.setdefault("until", timezone.now())
+        attrs.setdefault("since", attrs["until"] - timedelta(days=1))
+        if attrs["since"] > attrs["until"]:
+            raise ValidationError({"since": "Since must be before until."})
+        return attrs
+
+
+class ProductSalesRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductSalesRollup
+        fields = ("hour", "product", "quantity", "revenue")
+
+
+class OrderStatusRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderStatusRollup
+        fields = ("hour", "status", "count")
@@ -1,31 +1,83 @@
-from django.dispatch import receiver
-from django.db.models.signals import pre_save
-from django.core.mail import send_mail
-
-from .models import Order
+from rest_framework.authtoken.models import Token
 
+from django.conf import settings
+from django.dispatch import receiver
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 
-STATUS_CHANGED_NOTIFICATION_EMAIL_TEMPLATE = (
-    "Dear {},\n\nYour order {} status has changed to {}."
+from .authentication import token_user_cache
+from .cache import invalidate_catalog_on_commit
+from .feed import order_feed
+from .models import (
+    Product,
+    Order,
+    OrderDetail,
+    OrderStatusNotification,
+    OrderStatusRollup,
+    ProductSalesRollup,
 )
+from .options import option_schemas
 
 
-@receiver(pre_save, sender=Order, dispatch_uid="send_email_on_status_change")
-def send_email_on_status_change(sender, instance, *args, **kwargs):
+@receiver(pre_save, sender=Order, dispatch_uid="queue_email_on_status_change")
+def queue_email_on_status_change(sender, instance, *args, **kwargs):
+    if instance.pk is None:
+        return
     try:
-        existing_sender = sender.objects.get(pk=instance.pk)
-        if existing_sender.status != instance.status:
-            # TODO: do this in a celery task
-            send_mail(
-                subject="Order status changed",
-                message=STATUS_CHANGED_NOTIFICATION_EMAIL_TEMPLATE.format(
-                    instance.user.first_name or instance.user.username,
-                    instance.pk,
-                    instance.get_status_display(),
-                ),
-                from_email=None,
-                recipient_list=(instance.user.email,),
-                fail_silently=False,
+        if instance.get_loaded_value("status") != instance.status:
+            # queued in the order transaction and sent by send_order_notifications.
+            OrderStatusNotification.objects.create(
+                order_id=instance.pk, status=instance.status
             )
+            OrderStatusRollup.record(instance.status)
     except sender.DoesNotExist:
         pass
+
+
+@receiver(post_save, sender=Order, dispatch_uid="record_created_order")
+def record_created_order(sender, instance, created, raw=False, *args, **kwargs):
+    # every order starts out waiting, whatever it's created with.
+    if created and not raw:
+        OrderStatusRollup.record("W", moment=instance.created_at)
+
+
+@receiver(pre_delete, sender=Order, dispatch_uid="remove_deleted_order_rollups")
+def remove_deleted_order_rollups(sender, instance, *args, **kwargs):
+    # take the order out of the rollups, as a rebuild won't find it either.
+    ProductSalesRollup.record(
+        OrderDetail.objects.filter(order_id=instance.pk).values(
+            "product_id", "unit_price"
+        ),
+        instance.created_at,
+        sign=-1,
+    )
+    OrderStatusRollup.record("W", -1, instance.created_at)
+    for notification in OrderStatusNotification.objects.filter(
+        order_id=instance.pk
+    ).values("status", "created_at"):
+        OrderStatusRollup.record(notification["status"], -1, notification["created_at"])
+
+
+@receiver(post_save, sender=Order, dispatch_uid="publish_saved_order")
+@receiver(post_delete, sender=Order, dispatch_uid="publish_deleted_order")
+def publish_order_change(sender, instance, *args, **kwargs):
+    order_feed.publish_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Product, dispatch_uid="invalidate_catalog_on_save")
+@receiver(post_delete, sender=Product, dispatch_uid="invalidate_catalog_on_delete")
+def invalidate_catalog_on_product_change(sender, instance, *args, **kwargs):
+    invalidate_catalog_on_commit()
+    option_schemas.delete(instance.pk)
+
+
+@receiver(post_delete, sender=Token, dispatch_uid="forget_deleted_token")
+def forget_deleted_token(sender, instance, *args, **kwargs):
+    token_user_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid="forget_saved_user")
+@receiver(
+    post_delete, sender=settings.AUTH_USER_MODEL, dispatch_uid="forget_deleted_user"
+)
+def forget_changed_user(sender, instance, *args, **kwargs):
+    token_user_cache.delete_user(instance.pk)
@@ -1,12 +1,73 @@
+import asyncio
+import base64
+import csv
+import json
+import os
+import tempfile
+import re
+import threading
+import time
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
 
+from django.conf import settings
+from django.core.asgi import get_asgi_application
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    modify_settings,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+
+from RestBucks.db import database_config
+from RestBucks.routers import ReplicaPinMiddleware, ReplicaRouter, current_request
 
-from .models import Product, Order
-from .signals import STATUS_CHANGED_NOTIFICATION_EMAIL_TEMPLATE
+from .authentication import token_user_cache
+from .cache import get_catalog_state, invalidate_catalog
+from .management.commands.bulk_load import iter_json_array
+from .middleware import registry as metrics_registry
+from .models import (
+    Product,
+    Order,
+    OrderDetail,
+    OrderStatusNotification,
+    OrderStatusRollup,
+    ProductSalesRollup,
+    IdempotencyKey,
+    get_hour,
+)
+from .options import option_schemas
+from .renderers import FastJSONRenderer
+from .serializers import ProductSerializer, OrderSerializer, OrderDetailSerializer
+from .throttling import UserBucketThrottle
+from .outbox import (
+    STATUS_CHANGED_NOTIFICATION_EMAIL_TEMPLATE,
+    send_pending_notifications,
+)
 
 
 class ProductTest(APITestCase):
@@ -34,6 +95,7 @@ class ProductTest(APITestCase):
             return data
 
     def setUp(self) -> None:
+        cache.clear()
         self.product_pk = Product.objects.last().pk
 
     def test_list_product(self) -> None:
@@ -41,7 +103,7 @@ class ProductTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         expected_products = self.product_json(Product.objects.all())
-        self.assertListEqual(response.data, expected_products)
+        self.assertListEqual(response.data["results"], expected_products)
 
     def test_retrieve_product(self) -> None:
         response = self.client.get(
@@ -52,6 +114,76 @@ class ProductTest(APITestCase):
         expected_product = self.product_json(Product.objects.get(pk=self.product_pk))
         self.assertDictEqual(response.data, expected_product)
 
+    def test_list_product_from_cache(self) -> None:
+        self.client.get(reverse("product-list"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("product-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        expected_products = self.product_json(Product.objects.all())
+        self.assertListEqual(response.data["results"], expected_products)
+
+    def test_list_product_cache_key(self) -> None:
+        self.client.get(reverse("product-list") + "?page_size=2")
+        # parameters not selecting the page share its cache entry.
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse("product-list") + "?page_size=2&unused=1"
+            )
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(response.data["next"])
+        self.assertListEqual(
+            response.data["results"],
+            self.product_json(Product.objects.order_by("id")[2:4]),
+        )
+
+    def test_list_product_not_modified(self) -> None:
+        response = self.client.get(reverse("product-list"))
+
+        response = self.client.get(
+            reverse("product-list"), HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(
+            reverse("product-list"),
+            HTTP_IF_MODIFIED_SINCE=response["Last-Modified"],
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_retrieve_product_invalidated_on_save(self) -> None:
+        url = reverse("product-detail", kwargs={"pk": self.product_pk})
+        etag = self.client.get(url)["ETag"]
+
+        product = Product.objects.get(pk=self.product_pk)
+        product.price += 1
+        product.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertDictEqual(response.data, self.product_json(product))
+
+    def test_retrieve_invalid_product(self) -> None:
+        response = self.client.get(reverse("product-detail", kwargs={"pk": 1000000}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_fast_product_representation(self) -> None:
+        products = Product.objects.order_by("id")
+        self.assertEqual(
+            FastJSONRenderer().render(
+                ProductSerializer.fast_data(
+                    list(products.values(*ProductSerializer.fast_fields))
+                )
+            ),
+            JSONRenderer().render(ProductSerializer(products, many=True).data),
+        )
+
+    def test_fast_json_renderer(self) -> None:
+        data = {"name": "caf\u00e9 \u2028", 1: [10, None, True], "price": 1.5}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
 
 class OrderTest(APITestCase):
     fixtures = (
@@ -74,6 +206,10 @@ class OrderTest(APITestCase):
                             "price": order_detail.product.price,
                         },
                         "chosen_option": order_detail.chosen_option,
+                        "resolved_option": {
+                            name: order_detail.product.options[name][index]
+                            for name, index in order_detail.chosen_option.items()
+                        },
                     }
                     for order_detail in object.orderdetail_set.all()
                 ],
@@ -93,6 +229,10 @@ class OrderTest(APITestCase):
                                 "price": order_detail.product.price,
                             },
                             "chosen_option": order_detail.chosen_option,
+                            "resolved_option": {
+                                name: order_detail.product.options[name][index]
+                                for name, index in order_detail.chosen_option.items()
+                            },
                         }
                         for order_detail in order.orderdetail_set.all()
                     ],
@@ -117,8 +257,34 @@ class OrderTest(APITestCase):
         response = self.client.get(reverse("order-list"))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        expected_orders = self.order_json(Order.objects.filter(user=self.user.id))
-        self.assertListEqual(response.data, expected_orders)
+        expected_orders = self.order_json(
+            Order.objects.filter(user=self.user.id).order_by("id")
+        )
+        self.assertListEqual(response.data["results"], expected_orders)
+
+    def test_list_order_pages(self):
+        Order.objects.bulk_create([Order(user=self.user) for _ in range(3)])
+        expected_ids = list(
+            Order.objects.filter(user=self.user)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+        ids, url = [], reverse("order-list") + "?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            ids.extend(order["id"] for order in response.data["results"])
+            url = response.data["next"]
+        self.assertListEqual(ids, expected_ids)
+
+    @override_settings(API_MAX_PAGE_SIZE=2)
+    def test_list_order_max_page_size(self):
+        Order.objects.bulk_create([Order(user=self.user) for _ in range(3)])
+        response = self.client.get(reverse("order-list") + "?page_size=100")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
 
     def test_anonymous_client_list_order(self):
         response = self.anonymous_client.get(reverse("order-list"))
@@ -135,6 +301,83 @@ class OrderTest(APITestCase):
         )
         self.assertDictEqual(response.data, expected_order)
 
+    def test_list_order_query_count(self):
+        for _ in range(10):
+            order = Order.objects.create(user=self.user)
+            OrderDetail.objects.bulk_create(
+                [
+                    OrderDetail(order=order, product_id=1),
+                    OrderDetail(order=order, product_id=2),
+                ]
+            )
+
+        # one query for the orders and one for their details with products
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 12)
+
+    def test_retrieve_order_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("order-detail", kwargs={"pk": self.order_pk})
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_fast_order_representation(self):
+        orders = Order.objects.filter(user=self.user).order_by("id")
+        self.assertEqual(
+            FastJSONRenderer().render(
+                OrderSerializer.fast_data(
+                    list(orders.values(*OrderSerializer.fast_fields))
+                )
+            ),
+            JSONRenderer().render(
+                OrderSerializer(orders.with_details(), many=True).data
+            ),
+        )
+
+    def test_export_order_ndjson(self):
+        response = self.client.get(reverse("order-export"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        orders = [json.loads(line) for line in lines]
+        expected_orders = Order.objects.filter(user=self.user).order_by("id")
+        self.assertListEqual(
+            [order["id"] for order in orders], [order.id for order in expected_orders]
+        )
+        for order, expected_order in zip(orders, expected_orders):
+            self.assertEqual(order["total_price"], expected_order.total_price)
+            self.assertEqual(
+                len(order["order_details"]), expected_order.orderdetail_set.count()
+            )
+
+    def test_export_order_csv(self):
+        response = self.client.get(reverse("order-export") + "?export_format=csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        rows = list(
+            csv.DictReader(b"".join(response.streaming_content).decode().splitlines())
+        )
+        self.assertEqual(
+            len(rows), OrderDetail.objects.filter(order__user=self.user).count()
+        )
+        self.assertEqual(rows[0]["product_name"], "Tea")
+
+    def test_export_order_with_invalid_format(self):
+        response = self.client.get(reverse("order-export") + "?export_format=xml")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_orders_command_query_count(self):
+        Order.objects.bulk_create([Order(user=self.user) for _ in range(10)])
+        output = StringIO()
+        # one chunked query for the orders and one for the details of each chunk.
+        with self.assertNumQueries(4):
+            call_command("export_orders", "--chunk-size=5", stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 12)
+
     def test_anonymous_client_retrieve_order(self):
         response = self.anonymous_client.get(
             reverse("order-detail", kwargs={"pk": self.order_pk})
@@ -157,6 +400,39 @@ class OrderTest(APITestCase):
         expected_order = self.order_json(Order.objects.last())
         self.assertDictEqual(response.data, expected_order)
 
+    def test_create_order_total_price(self):
+        response = self.client.post(
+            reverse("order-list"),
+            data={
+                "order_details": [
+                    {"product": {"id": 1}},
+                    {"product": {"id": 1}},
+                    {"product": {"id": 2}},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["total_price"], 10000 + 10000 + 30000)
+
+        # a price change doesn't rewrite the total of existing orders.
+        Product.objects.filter(pk=1).update(price=1)
+        order = Order.objects.get(pk=response.data["id"])
+        self.assertEqual(order.total_price, 50000)
+
+    def test_backfill_order_prices(self):
+        OrderDetail.objects.update(unit_price=None)
+        Order.objects.update(total_price=0)
+
+        call_command("backfill_order_prices", stdout=StringIO())
+
+        self.assertFalse(OrderDetail.objects.filter(unit_price__isnull=True).exists())
+        for order in Order.objects.all():
+            self.assertEqual(
+                order.total_price,
+                sum(product.price for product in order.products.all()),
+            )
+
     def test_create_order_with_empty_products(self):
         response = self.client.post(
             reverse("order-list"),
@@ -177,6 +453,154 @@ class OrderTest(APITestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_order_reports_every_invalid_order_detail(self):
+        response = self.client.post(
+            reverse("order-list"),
+            data={
+                "order_details": [
+                    {"product": {"id": 1}},
+                    {"product": {"id": 1000000}},
+                    {"product": {"id": 2}, "chosen_option": {"milk": 3}},
+                    {"product": {"id": 2}, "chosen_option": {"size": 0}},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        errors = response.data["order_details"]
+        self.assertEqual(len(errors), 4)
+        self.assertDictEqual(errors[0], {})
+        self.assertIn("product", errors[1])
+        self.assertIn("chosen_option", errors[2])
+        self.assertIn("chosen_option", errors[3])
+
+    def test_order_details_validation_query_count(self):
+        order_details_data = [
+            {"product": {"id": product_id % 6 + 1}, "chosen_option": {"size": 1}}
+            if product_id % 6 + 1 in (3, 5)
+            else {"product": {"id": product_id % 6 + 1}}
+            for product_id in range(50)
+        ]
+        with self.assertNumQueries(1):
+            order_details = OrderSerializer.get_order_details(order_details_data)
+        self.assertEqual(len(order_details), 50)
+
+    def test_create_order_resolved_option(self):
+        response = self.client.post(
+            reverse("order-list"),
+            data={
+                "order_details": [
+                    {"product": {"id": 2}, "chosen_option": {"milk": 2}},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertDictEqual(
+            response.data["order_details"][0]["resolved_option"],
+            {"consume location": "take away", "milk": "whole"},
+        )
+
+    def test_option_schema_recompiled_on_product_save(self):
+        order_details_data = [{"product": {"id": 2}, "chosen_option": {"milk": 3}}]
+        with self.assertRaises(ValidationError):
+            OrderSerializer.get_order_details(order_details_data)
+
+        product = Product.objects.get(pk=2)
+        product.options["milk"].append("oat")
+        product.save()
+        order_details = OrderSerializer.get_order_details(order_details_data)
+        self.assertEqual(order_details[0].chosen_option["milk"], 3)
+
+    def test_option_schema_not_cached_under_later_catalog_version(self):
+        get_products = OrderSerializer.get_products
+
+        def get_products_then_change_catalog(orders_details_data):
+            products = get_products(orders_details_data)
+            invalidate_catalog()
+            return products
+
+        option_schemas.delete(2)
+        with mock.patch.object(
+            OrderSerializer, "get_products", get_products_then_change_catalog
+        ):
+            response = self.client.post(
+                reverse("order-list"),
+                data={
+                    "order_details": [
+                        {"product": {"id": 2}, "chosen_option": {"milk": 2}},
+                    ]
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            response.data["order_details"][0]["resolved_option"]["milk"], "whole"
+        )
+        version = get_catalog_state()["version"]
+        self.assertIsNone(option_schemas.get_cached(2, version))
+
+        order_detail = OrderDetail.objects.filter(product_id=2).first()
+        data = OrderDetailSerializer(order_detail).data
+        self.assertEqual(data["resolved_option"]["milk"], "whole")
+        self.assertIsNone(option_schemas.get_cached(2, version))
+
+    def test_product_with_invalid_options(self):
+        product = Product(name="Mocha", price=40000, options={"size": []})
+        with self.assertRaises(DjangoValidationError) as error:
+            product.full_clean()
+        self.assertIn("options", error.exception.message_dict)
+
+    def test_bulk_create_order(self):
+        orders_data = [
+            {"order_details": [{"product": {"id": 1}}]},
+            {"order_details": [{"product": {"id": 1000000}}]},
+            {"order_details": []},
+            {"order_details": [{"product": {"id": 2}, "chosen_option": {"milk": 2}}]},
+            {"order_details": "invalid"},
+        ]
+        response = self.client.post(
+            reverse("order-bulk"), data=orders_data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+
+        statuses = [result["status"] for result in response.data]
+        self.assertListEqual(statuses, [201, 400, 400, 201, 400])
+        for result in (response.data[0], response.data[3]):
+            expected_order = self.order_json(
+                Order.objects.get(pk=result["order"]["id"])
+            )
+            self.assertDictEqual(result["order"], expected_order)
+
+    def test_bulk_create_order_query_count(self):
+        def bulk_create(count):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(
+                    reverse("order-bulk"),
+                    data=[
+                        {
+                            "order_details": [
+                                {"product": {"id": 1}},
+                                {"product": {"id": 4}},
+                            ]
+                        }
+                    ]
+                    * count,
+                    format="json",
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(response.data), count)
+            return len(context.captured_queries)
+
+        # the first orders of the hour create its rollup buckets.
+        bulk_create(1)
+        self.assertEqual(bulk_create(2), bulk_create(20))
+
+    def test_bulk_create_order_with_empty_list(self):
+        response = self.client.post(reverse("order-bulk"), data=[], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_anonymous_client_create_order(self):
         response = self.anonymous_client.post(
             reverse("order-list"),
@@ -201,6 +625,103 @@ class OrderTest(APITestCase):
         expected_order = self.order_json(Order.objects.get(pk=self.order_pk))
         self.assertDictEqual(response.data, expected_order)
 
+    def test_partial_update_order(self):
+        order_detail_ids = set(
+            OrderDetail.objects.filter(order_id=self.order_pk)
+            .exclude(product_id=1)
+            .values_list("id", flat=True)
+        )
+        response = self.client.patch(
+            reverse("order-detail", kwargs={"pk": self.order_pk}),
+            data=[
+                {"action": "+", "order_details": [{"product": {"id": 2}}]},
+                {"action": "-", "order_details": [{"product": {"id": 1}}]},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        order = Order.objects.get(pk=self.order_pk)
+        expected_order = self.order_json(order)
+        self.assertDictEqual(response.data, expected_order)
+        self.assertEqual(order.total_price, 80000 + 30000 - 10000)
+        # untouched order details are kept as they are.
+        self.assertTrue(
+            order_detail_ids.issubset(
+                order.orderdetail_set.values_list("id", flat=True)
+            )
+        )
+
+    def test_partial_update_order_with_missing_products(self):
+        response = self.client.patch(
+            reverse("order-detail", kwargs={"pk": self.order_pk}),
+            data=[
+                {"action": "-", "order_details": [{"product": {"id": 2}}]},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_partial_update_order_with_invalid_chosen_option(self):
+        for chosen_option in ("abc", [1]):
+            response = self.client.patch(
+                reverse("order-detail", kwargs={"pk": self.order_pk}),
+                data=[
+                    {
+                        "action": "-",
+                        "order_details": [
+                            {"product": {"id": 1}, "chosen_option": chosen_option}
+                        ],
+                    }
+                ],
+                format="json",
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("chosen_option", response.data["order_details"][0])
+
+    def test_concurrent_partial_updates_keep_total_price(self):
+        serializer = OrderSerializer()
+        changes = [{"action": "+", "order_details": [{"product": {"id": 2}}]}]
+        # both changes start from the order as read before the other one.
+        first = Order.objects.get(pk=self.order_pk)
+        second = Order.objects.get(pk=self.order_pk)
+        serializer.change(first, changes)
+        serializer.change(second, changes)
+
+        order = Order.objects.get(pk=self.order_pk)
+        self.assertEqual(
+            order.total_price,
+            sum(order.orderdetail_set.values_list("unit_price", flat=True)),
+        )
+        self.assertEqual(second.total_price, order.total_price)
+
+    def test_partial_update_order_removing_every_product(self):
+        order_details = [
+            {
+                "product": {"id": order_detail.product_id},
+                "chosen_option": order_detail.chosen_option,
+            }
+            for order_detail in OrderDetail.objects.filter(order_id=self.order_pk)
+        ]
+        response = self.client.patch(
+            reverse("order-detail", kwargs={"pk": self.order_pk}),
+            data=[{"action": "-", "order_details": order_details}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            OrderDetail.objects.filter(order_id=self.order_pk).count(),
+            len(order_details),
+        )
+
+    def test_partial_update_none_waiting_order(self):
+        response = self.client.patch(
+            reverse("order-detail", kwargs={"pk": self.none_waiting_order_pk}),
+            data=[{"action": "+", "order_details": [{"product": {"id": 2}}]}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_update_order_with_empty_products(self):
         response = self.client.put(
             reverse("order-detail", kwargs={"pk": self.order_pk}),
@@ -259,6 +780,16 @@ class OrderTest(APITestCase):
         order.status = "P"
         order.save()
 
+        # the email is only queued on save.
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertTrue(
+            OrderStatusNotification.objects.filter(
+                order=order, status="P", state="P"
+            ).exists()
+        )
+
+        call_command("send_order_notifications", stdout=StringIO())
+
         self.assertEqual(len(mail.outbox), 1)  # inbox is not empty
         self.assertEqual(mail.outbox[0].subject, "Order status changed")
         self.assertEqual(
@@ -276,3 +807,1281 @@ class OrderTest(APITestCase):
                 order.user.email,
             ],
         )
+        self.assertEqual(OrderStatusNotification.objects.get(order=order).state, "S")
+
+    def test_send_mail_on_order_status_change_retry(self):
+        order = Order.objects.get(pk=self.order_pk)
+        order.status = "P"
+        order.save()
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=SMTPException,
+        ):
+            call_command(
+                "send_order_notifications", "--max-attempts=2", stdout=StringIO()
+            )
+        notification = OrderStatusNotification.objects.get(order=order)
+        self.assertEqual(notification.state, "P")
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        self.assertEqual(len(mail.outbox), 0)
+
+        # retried once the backoff is over and sent over the same backend.
+        OrderStatusNotification.objects.update(next_attempt_at=timezone.now())
+        call_command("send_order_notifications", stdout=StringIO())
+        self.assertEqual(OrderStatusNotification.objects.get(order=order).state, "S")
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_send_mail_with_unreachable_server(self):
+        order = Order.objects.get(pk=self.order_pk)
+        order.status = "P"
+        order.save()
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.open",
+            side_effect=ConnectionRefusedError,
+        ):
+            call_command("send_order_notifications", stdout=StringIO())
+        notification = OrderStatusNotification.objects.get(order=order)
+        self.assertEqual(notification.state, "P")
+        self.assertEqual(notification.attempts, 1)
+        self.assertIn("ConnectionRefusedError", notification.last_error)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_order_status_change_without_select(self):
+        order = Order.objects.get(pk=self.order_pk)
+        order.status = "P"
+        with CaptureQueriesContext(connection) as context:
+            order.save()
+        self.assertFalse(
+            any(query["sql"].startswith("SELECT") for query in context.captured_queries)
+        )
+        self.assertEqual(OrderStatusNotification.objects.filter(order=order).count(), 1)
+
+        # saving again without a change doesn't queue another notification.
+        order.save()
+        self.assertEqual(OrderStatusNotification.objects.filter(order=order).count(), 1)
+
+    def test_bulk_order_status_transition(self):
+        Order.objects.bulk_create(
+            [Order(user=self.user, status=status) for status in "WWPPRD"]
+        )
+        changed = Order.objects.filter(user=self.user).transition_status("R")
+
+        preparation_orders = Order.objects.filter(user=self.user, status="P").count()
+        self.assertEqual(changed, 3)  # 2 created and 1 from the fixtures
+        self.assertEqual(preparation_orders, 0)
+        self.assertEqual(
+            OrderStatusNotification.objects.filter(status="R").count(), changed
+        )
+
+        with self.assertRaises(ValueError):
+            Order.objects.transition_status("W")
+
+
+class NotificationOutboxTest(TransactionTestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def test_order_save_while_sending(self):
+        order = Order.objects.get(pk=7)
+        order.status = "P"
+        order.save()
+        errors = []
+
+        def save_order():
+            # a barista updating an order from another connection.
+            try:
+                other = Order.objects.get(pk=order.pk)
+                other.status = "R"
+                other.save()
+            except Exception as error:  # noqa: B902
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        def send_messages(backend, messages):
+            self.assertFalse(connection.in_atomic_block)
+            thread = threading.Thread(target=save_order)
+            thread.start()
+            thread.join()
+            return len(messages)
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            send_messages,
+        ):
+            self.assertTupleEqual(send_pending_notifications(), (1, 0))
+
+        self.assertListEqual(errors, [])
+        self.assertEqual(Order.objects.get(pk=order.pk).status, "R")
+        self.assertEqual(
+            OrderStatusNotification.objects.get(order=order, status="P").state, "S"
+        )
+
+
+class TokenAuthenticationTest(APITestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        token_user_cache.clear()
+        self.user = get_user_model().objects.get(pk=2)
+        self.user.set_password("user1-password")
+        self.user.save()
+
+    def get_token(self) -> str:
+        response = self.client.post(
+            reverse("auth-token"),
+            data={"username": self.user.username, "password": "user1-password"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["token"]
+
+    def test_list_order_with_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.get_token()}")
+        response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        # the user is resolved from the in process cache on the next requests.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_order_with_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalid")
+        response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_list_order_with_deleted_token(self):
+        token = self.get_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        self.client.get(reverse("order-list"))
+
+        Token.objects.filter(key=token).delete()
+        response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_list_order_with_inactive_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.get_token()}")
+        self.client.get(reverse("order-list"))
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class QueryPlanTest(APITestCase):
+    """
+    Runs the queries of the order endpoints through EXPLAIN on a seeded dataset
+    and fails if any of them scans a whole order table.
+
+    """
+
+    fixtures = (
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+    tables = ("product_order", "product_orderdetail", "product_orderstatusnotification")
+
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.bulk_create(
+            [get_user_model()(username=f"customer{index}") for index in range(50)]
+        )
+        users = get_user_model().objects.filter(username__startswith="customer")
+        Order.objects.bulk_create(
+            [
+                Order(user=user, status="WPRDDDDDDD"[index % 10])
+                for user in users
+                for index in range(20)
+            ]
+        )
+        orders = Order.objects.all()
+        OrderDetail.objects.bulk_create(
+            [
+                OrderDetail(order=order, product_id=product_id, unit_price=10000)
+                for order in orders
+                for product_id in (1, 2, 4)
+            ]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        cls.user = users[0]
+        cls.order_pk = Order.objects.filter(user=cls.user, status="W").first().pk
+
+    def setUp(self) -> None:
+        self.client.force_authenticate(user=self.user)
+
+    def explain(self, sql: str) -> list:
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f"EXPLAIN {sql}")
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_partial_indexes(self) -> set:
+        with connection.cursor() as cursor:
+            indexes = set()
+            for table in self.tables:
+                cursor.execute(f"PRAGMA index_list({table})")
+                indexes.update(row[1] for row in cursor.fetchall() if row[4])
+            return indexes
+
+    def is_full_scan(self, step: str) -> bool:
+        if connection.vendor == "sqlite":
+            # scanning a partial index only reads the rows matching its condition.
+            match = re.match(
+                rf"SCAN (TABLE )?({'|'.join(self.tables)})\b"
+                r"(?: USING (?:COVERING )?INDEX (\w+))?",
+                step,
+            )
+            return bool(match) and match[3] not in self.get_partial_indexes()
+        return any(f"Seq Scan on {table}" in step for table in self.tables)
+
+    def assertNoFullScans(self, run):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest(f"Query plans of {connection.vendor} are not supported.")
+        with CaptureQueriesContext(connection) as context:
+            response = run()
+        if response is not None:
+            self.assertLess(response.status_code, 400)
+
+        for query in context.captured_queries:
+            if not re.match(r"(SELECT|UPDATE|DELETE)\b", query["sql"]):
+                continue
+            plan = self.explain(query["sql"])
+            scans = [step for step in plan if self.is_full_scan(step)]
+            self.assertFalse(scans, f"{query['sql']}\n{plan}")
+
+    def test_list_order_plan(self):
+        self.assertNoFullScans(lambda: self.client.get(reverse("order-list")))
+
+    def test_list_order_next_page_plan(self):
+        response = self.client.get(reverse("order-list") + "?page_size=5")
+        self.assertNoFullScans(lambda: self.client.get(response.data["next"]))
+
+    def test_retrieve_order_plan(self):
+        self.assertNoFullScans(
+            lambda: self.client.get(
+                reverse("order-detail", kwargs={"pk": self.order_pk})
+            )
+        )
+
+    def test_update_order_plan(self):
+        self.assertNoFullScans(
+            lambda: self.client.put(
+                reverse("order-detail", kwargs={"pk": self.order_pk}),
+                data={"order_details": [{"product": {"id": 1}}]},
+                format="json",
+            )
+        )
+
+    def test_order_queue_plan(self):
+        self.client.force_authenticate(user=get_user_model().objects.get(pk=1))
+        self.assertNoFullScans(
+            lambda: self.client.get(reverse("order-queue"), {"timeout": 0})
+        )
+
+    def test_partial_update_order_plan(self):
+        self.assertNoFullScans(
+            lambda: self.client.patch(
+                reverse("order-detail", kwargs={"pk": self.order_pk}),
+                data=[{"action": "+", "order_details": [{"product": {"id": 2}}]}],
+                format="json",
+            )
+        )
+
+    def test_delete_order_plan(self):
+        self.assertNoFullScans(
+            lambda: self.client.delete(
+                reverse("order-detail", kwargs={"pk": self.order_pk})
+            )
+        )
+
+    def test_status_transition_plan(self):
+        def transition_status():
+            Order.objects.filter(user=self.user).transition_status("P")
+
+        self.assertNoFullScans(transition_status)
+
+    def test_full_scan_detected(self):
+        def filter_by_total_price():
+            list(Order.objects.filter(total_price=1))
+
+        with self.assertRaises(AssertionError):
+            self.assertNoFullScans(filter_by_total_price)
+
+
+class OrderAdminTest(TestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        self.client.force_login(get_user_model().objects.get(username="admin"))
+
+    def get_changelist_queries(self, query: str = "") -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("admin:product_order_changelist") + query
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_changelist_query_count(self):
+        queries = self.get_changelist_queries()
+
+        user = get_user_model().objects.get(pk=2)
+        for _ in range(30):
+            order = Order.objects.create(user=user, total_price=10000)
+            OrderDetail.objects.create(order=order, product_id=1, unit_price=10000)
+        self.assertEqual(self.get_changelist_queries(), queries)
+
+        # the user filter doesn't list the users.
+        get_user_model().objects.bulk_create(
+            [get_user_model()(username=f"customer{index}") for index in range(30)]
+        )
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse("admin:product_order_changelist"))
+        self.assertFalse(
+            any(
+                re.search(r'FROM "auth_user"(?! INNER| WHERE)', query["sql"])
+                for query in context.captured_queries
+            )
+        )
+
+    def test_changelist_filters(self):
+        user = get_user_model().objects.get(pk=2)
+        for value in (user.pk, user.username):
+            response = self.client.get(
+                reverse("admin:product_order_changelist"),
+                {"status__exact": "P", "user": value},
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.context["cl"].result_count, 1)
+            self.assertContains(response, f'value="{value}"')
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=1)
+    def test_changelist_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        Order.objects.bulk_create([Order(user_id=2) for _ in range(3)])
+        response = self.client.get(reverse("admin:product_order_changelist"))
+        # the statistics still estimate the table before the new orders.
+        self.assertEqual(response.context["cl"].result_count, 2)
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=1)
+    def test_changelist_estimated_count_with_partial_index(self):
+        Order.objects.bulk_create([Order(user_id=2, status="D") for _ in range(8)])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        response = self.client.get(reverse("admin:product_order_changelist"))
+        # the open orders index only counts the orders not delivered.
+        self.assertEqual(response.context["cl"].result_count, Order.objects.count())
+
+
+class BulkLoadTest(TestCase):
+    fixtures_paths = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def test_bulk_load_fixtures(self):
+        output = StringIO()
+        call_command("bulk_load", *self.fixtures_paths, "--batch-size=2", stdout=output)
+
+        self.assertIn("rows/s", output.getvalue())
+        self.assertEqual(Product.objects.count(), 6)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderDetail.objects.count(), 6)
+        self.assertEqual(get_user_model().objects.count(), 2)
+        self.assertEqual(Order.objects.get(pk=7).total_price, 80000)
+        self.assertEqual(
+            sum(OrderStatusRollup.objects.values_list("count", flat=True)), 2
+        )
+        self.assertEqual(
+            sum(ProductSalesRollup.objects.values_list("revenue", flat=True)),
+            sum(Order.objects.values_list("total_price", flat=True)),
+        )
+
+        # new rows continue after the loaded primary keys.
+        order = Order.objects.create(user_id=2)
+        self.assertGreater(order.pk, 14)
+
+    def test_bulk_load_ndjson(self):
+        with open("product/fixtures/products.json") as fixture:
+            products = json.load(fixture)
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as fixture:
+            fixture.writelines(json.dumps(product) + "\n" for product in products)
+            fixture.flush()
+            call_command("bulk_load", fixture.name, stdout=StringIO())
+
+        self.assertEqual(Product.objects.count(), len(products))
+
+    def test_iter_json_array_across_chunks(self):
+        with open("product/fixtures/order_details.json") as fixture:
+            expected = json.load(fixture)
+        with open("product/fixtures/order_details.json") as fixture:
+            self.assertListEqual(list(iter_json_array(fixture, chunk_size=7)), expected)
+
+    def test_bulk_load_truncated_fixture(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as fixture:
+            fixture.write('[{"model": "product.product", "pk": 1, ')
+            fixture.flush()
+            with self.assertRaises(CommandError):
+                call_command("bulk_load", fixture.name, stdout=StringIO())
+        self.assertFalse(Product.objects.exists())
+
+
+@modify_settings(MIDDLEWARE={"append": "product.middleware.InstrumentationMiddleware"})
+class InstrumentationTest(APITestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        metrics_registry.clear()
+        self.client.force_authenticate(user=get_user_model().objects.get(pk=2))
+
+    def test_server_timing(self):
+        response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        timings = response["Server-Timing"]
+        self.assertIn("total;dur=", timings)
+        self.assertIn('desc="2 queries"', timings)
+        self.assertIn("serialize;dur=", timings)
+        self.assertNotIn("X-Query-Budget-Exceeded", response)
+
+    @override_settings(INSTRUMENTATION_QUERY_BUDGET=1)
+    def test_query_budget_exceeded(self):
+        with self.assertLogs("product.middleware", level="WARNING"):
+            response = self.client.get(reverse("order-list"))
+        self.assertEqual(response["X-Query-Budget-Exceeded"], "2/1")
+
+    def test_metrics(self):
+        self.client.get(reverse("order-list"))
+        self.client.get(reverse("order-list"))
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = response.content.decode()
+        self.assertIn(
+            'restbucks_requests_total{view="order-list",method="GET"} 2', metrics
+        )
+        # the first request also fetches the options of the products.
+        self.assertIn(
+            'restbucks_db_queries_total{view="order-list",method="GET"} 5', metrics
+        )
+
+        # the histogram family has its buckets, sum and count, and nothing else.
+        family = metrics.partition(
+            "# TYPE restbucks_request_duration_seconds histogram\n"
+        )[2].splitlines()
+        samples = [
+            line.partition("{")[0] for line in family if 'view="order-list"' in line
+        ]
+        self.assertEqual(
+            samples[-3:],
+            [
+                "restbucks_request_duration_seconds_bucket",
+                "restbucks_request_duration_seconds_sum",
+                "restbucks_request_duration_seconds_count",
+            ],
+        )
+        self.assertIn(
+            'restbucks_request_duration_seconds_bucket{view="order-list",method="GET",'
+            'le="+Inf"} 2',
+            metrics,
+        )
+        self.assertIn(
+            'restbucks_request_duration_seconds_count{view="order-list",method="GET"} 2',
+            metrics,
+        )
+        self.assertNotIn("# TYPE restbucks_request_duration_seconds_sum", metrics)
+
+    def test_metrics_from_remote_address(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncViewTest(TransactionTestCase):
+    databases = "__all__"
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        cache.clear()
+        token_user_cache.clear()
+        self.token = Token.objects.create(user_id=2).key
+
+    async def test_product_list(self):
+        response = await self.async_client.get(reverse("async-product-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        expected_products = await sync_to_async(ProductTest.product_json)(
+            Product.objects.order_by("id")
+        )
+        self.assertListEqual(response.json()["results"], expected_products)
+
+        # responds like the sync view, conditional requests included.
+        response = await self.async_client.get(
+            reverse("async-product-list"), IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_product_detail(self):
+        response = await self.async_client.get(
+            reverse("async-product-detail", kwargs={"pk": 1})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["name"], "Tea")
+
+        response = await self.async_client.get(
+            reverse("async-product-detail", kwargs={"pk": 1000000})
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_order_detail(self):
+        response = await self.async_client.get(
+            reverse("async-order-detail", kwargs={"pk": 7}),
+            AUTHORIZATION=f"Token {self.token}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        expected_order = await sync_to_async(
+            lambda: OrderTest.order_json(Order.objects.get(pk=7))
+        )()
+        self.assertDictEqual(response.json(), expected_order)
+
+    async def test_anonymous_order_detail(self):
+        response = await self.async_client.get(
+            reverse("async-order-detail", kwargs={"pk": 7})
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = await self.async_client.get(
+            reverse("async-order-detail", kwargs={"pk": 7}),
+            AUTHORIZATION="Token invalid",
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_order_detail_with_basic_authentication(self):
+        user = await sync_to_async(get_user_model().objects.get)(pk=2)
+        user.set_password("user1-password")
+        await sync_to_async(user.save)()
+        credentials = base64.b64encode(
+            f"{user.username}:user1-password".encode()
+        ).decode()
+        response = await self.async_client.get(
+            reverse("async-order-detail", kwargs={"pk": 7}),
+            AUTHORIZATION=f"Basic {credentials}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(
+        REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"address_read": "2/min"},
+        }
+    )
+    async def test_throttled(self):
+        for _ in range(2):
+            response = await self.async_client.get(reverse("async-product-list"))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.get(reverse("async-product-list"))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+
+class OrderQueueTest(APITestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        self.client.force_authenticate(user=get_user_model().objects.get(pk=1))
+        self.url = reverse("order-queue")
+
+    def poll(self, since: str = "") -> dict:
+        response = self.client.get(self.url, {"since": since, "timeout": 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_queue_snapshot(self):
+        data = self.poll()
+
+        self.assertTrue(data["snapshot"])
+        self.assertEqual(
+            [order["id"] for order in data["orders"]],
+            list(
+                Order.objects.exclude(status="D")
+                .order_by("id")
+                .values_list("id", flat=True)
+            ),
+        )
+
+    def test_queue_for_none_staff_user(self):
+        self.client.force_authenticate(user=get_user_model().objects.get(pk=2))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_queue_changes(self):
+        cursor = self.poll()["cursor"]
+        data = self.poll(cursor)
+        self.assertFalse(data["snapshot"])
+        self.assertEqual(data["orders"], [])
+
+        order = Order.objects.filter(status="W").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.filter(pk=order.pk).transition_status("P")
+        data = self.poll(cursor)
+
+        self.assertEqual([order["id"] for order in data["orders"]], [order.pk])
+        self.assertEqual(data["orders"][0]["status"], "P")
+        self.assertNotEqual(data["cursor"], cursor)
+
+        cursor, order_pk = data["cursor"], order.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+        data = self.poll(cursor)
+        self.assertEqual(data["orders"], [])
+        self.assertEqual(data["removed"], [order_pk])
+
+    def test_queue_with_unknown_cursor(self):
+        self.assertTrue(self.poll("stale:1")["snapshot"])
+
+    def test_queue_event_stream(self):
+        response = self.client.get(
+            self.url, {"timeout": 0}, HTTP_ACCEPT="text/event-stream"
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = iter(response.streaming_content)
+
+        event_id, event, data = next(events).decode().strip().splitlines()
+        self.assertTrue(event_id.startswith("id: "))
+        self.assertEqual(event, "event: snapshot")
+        self.assertTrue(json.loads(data.partition(": ")[2])["snapshot"])
+        self.assertEqual(next(events), b": keep-alive\n\n")
+
+    @override_settings(ORDER_QUEUE_MIN_STREAM_TIMEOUT=0.2)
+    def test_queue_event_stream_waits_between_events(self):
+        response = self.client.get(
+            self.url, {"timeout": 0}, HTTP_ACCEPT="text/event-stream"
+        )
+        events = iter(response.streaming_content)
+        next(events)
+
+        started = time.monotonic()
+        self.assertEqual(next(events), b": keep-alive\n\n")
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_queue_with_invalid_timeout(self):
+        for timeout in ("soon", "nan", "inf"):
+            response = self.client.get(self.url, {"timeout": timeout})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderQueueASGITest(TransactionTestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        token_user_cache.clear()
+        self.token = Token.objects.create(user_id=1).key
+
+    async def read_stream(self, query: str = "timeout=0", headers: tuple = ()):
+        communicator = ApplicationCommunicator(
+            get_asgi_application(),
+            {
+                "type": "http",
+                "asgi": {"version": "3"},
+                "http_version": "1.1",
+                "method": "GET",
+                "scheme": "http",
+                "path": reverse("order-queue"),
+                "query_string": query.encode(),
+                "headers": [
+                    (b"host", b"testserver"),
+                    (b"accept", b"text/event-stream"),
+                    (b"authorization", f"Token {self.token}".encode()),
+                    *headers,
+                ],
+            },
+        )
+        await communicator.send_input({"type": "http.request", "body": b""})
+        start = await communicator.receive_output(timeout=5)
+        body = b""
+        while True:
+            message = await communicator.receive_output(timeout=5)
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await communicator.wait()
+        return start, body.decode()
+
+    @override_settings(ORDER_QUEUE_MIN_STREAM_TIMEOUT=0.1)
+    async def test_queue_event_stream(self):
+        start, body = await self.read_stream()
+        self.assertEqual(start["status"], status.HTTP_200_OK)
+        self.assertIn((b"Content-Type", b"text/event-stream"), start["headers"])
+        event_id, event, data = body.strip().splitlines()
+        self.assertEqual(event, "event: snapshot")
+        self.assertTrue(json.loads(data.partition(": ")[2])["snapshot"])
+
+        # the reconnecting client resumes from the last event.
+        last_event_id = event_id.partition(": ")[2]
+        start, body = await self.read_stream(
+            headers=((b"last-event-id", last_event_id.encode()),)
+        )
+        self.assertEqual(start["status"], status.HTTP_200_OK)
+        self.assertEqual(body, ": keep-alive\n\n")
+
+
+class RollupTest(APITestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=2)
+        self.client.force_authenticate(user=self.user)
+        call_command("rebuild_rollups", stdout=StringIO())
+
+    def get_rollups(self) -> tuple:
+        sales = {
+            (rollup.product_id, rollup.hour): (rollup.quantity, rollup.revenue)
+            for rollup in ProductSalesRollup.objects.all()
+            if rollup.quantity
+        }
+        statuses = {
+            (rollup.hour, rollup.status): rollup.count
+            for rollup in OrderStatusRollup.objects.all()
+            if rollup.count
+        }
+        return sales, statuses
+
+    def test_rollups_on_create(self):
+        response = self.client.post(
+            reverse("order-list"),
+            data={"order_details": [{"product": {"id": 2}}, {"product": {"id": 2}}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        hour = get_hour(Order.objects.get(pk=response.data["id"]).created_at)
+        rollup = ProductSalesRollup.objects.get(product_id=2, hour=hour)
+        self.assertEqual((rollup.quantity, rollup.revenue), (2, 60000))
+        self.assertEqual(OrderStatusRollup.objects.get(hour=hour, status="W").count, 1)
+
+    def test_rollups_match_rebuild(self):
+        response = self.client.post(
+            reverse("order-bulk"),
+            data=[{"order_details": [{"product": {"id": 1}}, {"product": {"id": 4}}]}]
+            * 3,
+            format="json",
+        )
+        order_ids = [result["order"]["id"] for result in response.data]
+        response = self.client.put(
+            reverse("order-detail", kwargs={"pk": order_ids[0]}),
+            data={"order_details": [{"product": {"id": 6}}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.patch(
+            reverse("order-detail", kwargs={"pk": order_ids[1]}),
+            data=[
+                {"action": "-", "order_details": [{"product": {"id": 4}}]},
+                {"action": "+", "order_details": [{"product": {"id": 5}}]},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.delete(
+            reverse("order-detail", kwargs={"pk": order_ids[2]})
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        Order.objects.filter(pk=order_ids[0]).transition_status("P")
+        order = Order.objects.get(pk=order_ids[1])
+        order.status = "P"
+        order.save()
+
+        rollups = self.get_rollups()
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(rollups, self.get_rollups())
+
+    def test_rebuild_rollups_aggregates_in_transaction(self):
+        with CaptureQueriesContext(connection) as queries:
+            call_command("rebuild_rollups", stdout=StringIO())
+        sqls = [query["sql"] for query in queries.captured_queries]
+        first_delete = next(
+            index for index, sql in enumerate(sqls) if sql.startswith("DELETE")
+        )
+        aggregates = [index for index, sql in enumerate(sqls) if "GROUP BY" in sql]
+        self.assertEqual(len(aggregates), 3)
+        # the orders can't change between the aggregates and the inserts.
+        self.assertLess(first_delete, min(aggregates))
+
+    def test_rollups_on_bulk_create_one_by_one(self):
+        # databases that can't return the ids of a bulk insert get one insert each.
+        with mock.patch.object(connection, "vendor", "mysql"), mock.patch.object(
+            connection.features, "can_return_rows_from_bulk_insert", False
+        ):
+            response = self.client.post(
+                reverse("order-bulk"),
+                data=[{"order_details": [{"product": {"id": 1}}]}] * 3,
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order_ids = [result["order"]["id"] for result in response.data]
+        self.assertEqual(Order.objects.filter(pk__in=order_ids).count(), 3)
+
+        rollups = self.get_rollups()
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(rollups, self.get_rollups())
+
+    def test_analytics(self):
+        self.client.force_authenticate(user=get_user_model().objects.get(pk=1))
+        response = self.client.get(
+            reverse("analytics"),
+            {"since": "2021-08-22T00:00:00Z", "until": "2021-08-23T00:00:00Z"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(sale["product"], sale["quantity"]) for sale in response.data["sales"]],
+            list(
+                OrderDetail.objects.values("product_id")
+                .annotate(quantity=Count("id"))
+                .order_by("product_id")
+                .values_list("product_id", "quantity")
+            ),
+        )
+        self.assertEqual(
+            [statuses["count"] for statuses in response.data["statuses"]], [2]
+        )
+
+        response = self.client.get(reverse("analytics"), {"product": 1})
+        self.assertEqual(response.data["sales"], [])
+
+    def test_analytics_for_none_staff_user(self):
+        response = self.client.get(reverse("analytics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class IdempotencyTest(APITestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=2)
+        self.client.force_authenticate(user=self.user)
+        self.data = {"order_details": [{"product": {"id": 1}}]}
+
+    def create_order(self, data=None, key: str = "order-1"):
+        return self.client.post(
+            reverse("order-list"),
+            data=data or self.data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_create_order_retry(self):
+        response = self.create_order()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        orders = Order.objects.count()
+
+        # the retry is answered from the key alone.
+        with self.assertNumQueries(1):
+            retry = self.create_order()
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(Order.objects.count(), orders)
+
+    def test_create_order_with_reused_key(self):
+        self.create_order()
+        response = self.create_order({"order_details": [{"product": {"id": 2}}]})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_create_order_in_progress(self):
+        self.create_order()
+        IdempotencyKey.objects.update(state="P")
+        response = self.create_order()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_create_order_with_expired_key(self):
+        self.create_order()
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        orders = Order.objects.count()
+
+        response = self.create_order()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertEqual(Order.objects.count(), orders + 1)
+
+    def test_create_invalid_order_releases_key(self):
+        response = self.create_order({"order_details": [{"product": {"id": 1000}}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_keys_of_other_users(self):
+        self.create_order()
+        self.client.force_authenticate(user=get_user_model().objects.get(pk=1))
+        response = self.create_order()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+
+    def test_bulk_create_order_retry(self):
+        def bulk_create():
+            return self.client.post(
+                reverse("order-bulk"),
+                data=[self.data, self.data],
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="bulk-1",
+            )
+
+        response = bulk_create()
+        orders = Order.objects.count()
+        retry = bulk_create()
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(Order.objects.count(), orders)
+
+    def test_partial_update_order_retry(self):
+        def add_product():
+            return self.client.patch(
+                reverse("order-detail", kwargs={"pk": 7}),
+                data=[{"action": "+", "order_details": [{"product": {"id": 2}}]}],
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="add-latte",
+            )
+
+        response = add_product()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order_details = OrderDetail.objects.filter(order_id=7).count()
+        self.assertEqual(add_product().json(), response.json())
+        self.assertEqual(OrderDetail.objects.filter(order_id=7).count(), order_details)
+
+
+THROTTLE_RATES = {
+    "user_read": "3/min",
+    "user_write": "2/min",
+    "address_read": "4/min",
+    "address_write": "100/min",
+    "failed_authentication": "3/min",
+}
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": THROTTLE_RATES,
+    }
+)
+class ThrottleTest(APITestCase):
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.get(pk=2)
+        self.client.force_authenticate(user=self.user)
+
+    def create_order(self):
+        return self.client.post(
+            reverse("order-list"),
+            data={"order_details": [{"product": {"id": 1}}]},
+            format="json",
+        )
+
+    def test_user_write_budget(self):
+        for _ in range(2):
+            self.assertEqual(self.create_order().status_code, status.HTTP_201_CREATED)
+        response = self.create_order()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertLessEqual(int(response["Retry-After"]), 60)
+
+        # reads have a budget of their own, as do other users.
+        response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(user=get_user_model().objects.get(pk=1))
+        self.assertEqual(self.create_order().status_code, status.HTTP_201_CREATED)
+
+    def test_address_read_budget(self):
+        self.client.force_authenticate(user=None)
+        for _ in range(4):
+            response = self.client.get(reverse("product-list"))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse("product-list"))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        response = self.client.get(reverse("product-list"), REMOTE_ADDR="192.0.2.1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_address_ignores_untrusted_forwarded_for(self):
+        self.client.force_authenticate(user=None)
+        for index in range(5):
+            response = self.client.get(
+                reverse("product-list"), HTTP_X_FORWARDED_FOR=f"192.0.2.{index}"
+            )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_failed_authentication_budget(self):
+        self.client.force_authenticate(user=None)
+        credentials = base64.b64encode(b"user1:wrong-password").decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
+        for _ in range(3):
+            response = self.client.get(reverse("order-list"))
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # refused before the password is hashed.
+        with mock.patch("django.contrib.auth.backends.ModelBackend.authenticate") as (
+            authenticate
+        ):
+            response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        authenticate.assert_not_called()
+
+        response = self.client.get(reverse("order-list"), REMOTE_ADDR="192.0.2.1")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_failed_token_login_budget(self):
+        self.client.force_authenticate(user=None)
+        for _ in range(3):
+            response = self.client.post(
+                reverse("auth-token"),
+                data={"username": self.user.username, "password": "wrong-password"},
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            reverse("auth-token"),
+            data={"username": self.user.username, "password": "wrong-password"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_bucket_refilled_next_window(self):
+        request = Request(RequestFactory().get("/api/order/"))
+        request.user = self.user
+        now = 120.0
+
+        def allow_request():
+            throttle = UserBucketThrottle()
+            throttle.timer = lambda: now
+            return throttle.allow_request(request, None)
+
+        self.assertEqual([allow_request() for _ in range(4)], [True] * 3 + [False])
+        now += 60
+        self.assertTrue(allow_request())
+
+
+class DatabaseProfileTest(TestCase):
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            synchronous = cursor.fetchone()[0]
+            cursor.execute("PRAGMA busy_timeout")
+            busy_timeout = cursor.fetchone()[0]
+        self.assertEqual(synchronous, 1)  # NORMAL
+        self.assertEqual(busy_timeout, settings.SQLITE_PRAGMAS["busy_timeout"])
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+    def test_database_config(self):
+        config = database_config(settings.BASE_DIR, environ={})
+        self.assertEqual(config["ENGINE"], "RestBucks.backends.sqlite3")
+        self.assertGreater(config["CONN_MAX_AGE"], 0)
+
+        config = database_config(
+            settings.BASE_DIR,
+            environ={
+                "RESTBUCKS_DB_ENGINE": "postgresql",
+                "RESTBUCKS_DB_NAME": "orders",
+                "RESTBUCKS_DB_POOLER": "pgbouncer",
+            },
+        )
+        self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(config["NAME"], "orders")
+        self.assertTrue(config["DISABLE_SERVER_SIDE_CURSORS"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read(self, request=None, model=Order) -> str:
+        token = current_request.set(request)
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            current_request.reset(token)
+
+    def get_request(self, method: str = "get", user=None):
+        request = getattr(self.factory, method)("/api/order/")
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_reads_round_robin(self):
+        self.assertEqual(
+            [self.read(self.get_request()) for _ in range(4)],
+            ["replica1", "replica2", "replica1", "replica2"],
+        )
+        self.assertEqual(self.router.db_for_write(Order), "default")
+
+    def test_reads_of_other_apps(self):
+        self.assertIsNone(self.read(model=get_user_model()))
+
+    def test_reads_outside_requests(self):
+        self.assertEqual(self.read(), "default")
+
+    def test_async_middleware(self):
+        async def get_response(request):
+            return HttpResponse(status=201)
+
+        user = get_user_model()(pk=2)
+        middleware = ReplicaPinMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        async_to_sync(middleware)(self.get_request("post", user))
+        self.assertEqual(self.read(self.get_request(user=user)), "default")
+
+    def test_reads_of_unsafe_request(self):
+        self.assertEqual(self.read(self.get_request("post")), "default")
+
+    def test_reads_in_transaction(self):
+        with mock.patch.object(connections["default"], "in_atomic_block", True):
+            self.assertEqual(self.read(self.get_request()), "default")
+
+    def test_reads_after_write(self):
+        user, other_user = get_user_model()(pk=2), get_user_model()(pk=3)
+        middleware = ReplicaPinMiddleware(lambda request: HttpResponse(status=201))
+        middleware(self.get_request("post", user))
+
+        self.assertEqual(self.read(self.get_request(user=user)), "default")
+        self.assertEqual(self.read(self.get_request(user=other_user)), "replica1")
+
+    def test_migrate_replicas(self):
+        self.assertFalse(self.router.allow_migrate("replica1", "product"))
+        self.assertIsNone(self.router.allow_migrate("default", "product"))
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaDatabaseTest(APITransactionTestCase):
+    """
+    Serves the requests with a second SQLite database as the replica, a copy of
+    the primary taken before the test writes, so it lags behind like one.
+
+    """
+
+    fixtures = (
+        "product/fixtures/orders.json",
+        "product/fixtures/order_details.json",
+        "product/fixtures/products.json",
+        "product/fixtures/users.json",
+    )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        name = os.path.join(self.directory.name, "replica.sqlite3")
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM INTO %s", [name])
+        connections.settings["replica"] = {**connection.settings_dict, "NAME": name}
+        self.user = get_user_model().objects.get(pk=2)
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self) -> None:
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+        self.directory.cleanup()
+
+    def test_reads_from_replica(self):
+        order = Order.objects.filter(user=self.user, status="W").first()
+        Order.objects.filter(pk=order.pk).update(status="P")
+
+        response = self.client.get(reverse("order-detail", kwargs={"pk": order.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # the replica doesn't have the change yet.
+        self.assertEqual(response.data["status"], "W")
+
+    def test_catalog_reads_from_primary(self):
+        product = Product.objects.get(pk=3)
+        product.options["size"].append("extra large")
+        product.save()
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get(reverse("product-detail", kwargs={"pk": 3}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("extra large", response.data["options"]["size"])
+        response = self.client.get(reverse("product-list"))
+        products = {product["id"]: product for product in response.data["results"]}
+        self.assertIn("extra large", products[3]["options"]["size"])
+
+        # the orders are read from the replica, the option schemas aren't.
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("order-detail", kwargs={"pk": 7}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        schema = option_schemas.get_cached(3, get_catalog_state()["version"])
+        self.assertEqual(schema.resolve({"size": 3})["size"], "extra large")
+
+    def test_reads_after_write_from_primary(self):
+        response = self.client.post(
+            reverse("order-list"),
+            data={"order_details": [{"product": {"id": 1}}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(
+            Order.objects.using("replica").filter(pk=response.data["id"]).exists()
+        )
+
+        response = self.client.get(
+            reverse("order-detail", kwargs={"pk": response.data["id"]})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -0,0 +1,157 @@
+from rest_framework.authentication import get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class CacheBucketThrottle(SimpleRateThrottle):
+    """
+    Throttle giving each client a bucket of requests per window, with separate
+    read and write budgets. The bucket is a single counter in the shared cache,
+    created with cache.add and taken from with cache.incr, both atomic, so its
+    state doesn't grow with the rate like a history of request timestamps.
+    The bucket refills in full when the window turns over.
+
+    Rates are looked up per request from the "<scope>_read" and "<scope>_write"
+    entries of DEFAULT_THROTTLE_RATES.
+
+    """
+
+    cache_format = "throttle:%(scope)s:%(ident)s:%(window)d"
+
+    def __init__(self):
+        # the rate depends on the request method, see get_bucket_key.
+        pass
+
+    def get_ident_for(self, request):
+        """
+        Returns the identity of the client the bucket belongs to, or None when
+        the request isn't throttled.
+
+        """
+        raise NotImplementedError(".get_ident_for() must be overridden")
+
+    def get_scope(self, request) -> str:
+        access = "read" if request.method in SAFE_METHODS else "write"
+        return f"{type(self).scope}_{access}"
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_bucket_key(self, request):
+        """
+        Returns the cache key of the bucket of the client in the current window,
+        or None when the request isn't throttled.
+
+        """
+        self.scope = self.get_scope(request)
+        self.num_requests, self.duration = self.parse_rate(self.get_rate())
+        if self.num_requests is None:
+            return None
+        if (ident := self.get_ident_for(request)) is None:
+            return None
+
+        window = int(self.timer() // self.duration)
+        self.window_end = (window + 1) * self.duration
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": ident,
+            "window": window,
+        }
+
+    def take(self, key: str) -> int:
+        """
+        Takes a request from the bucket.
+
+        :return int: requests taken in the window
+        """
+        self.cache.add(key, 0, timeout=self.duration)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # evicted between the add and the increment.
+            self.cache.add(key, 1, timeout=self.duration)
+            return 1
+
+    def allow_request(self, request, view) -> bool:
+        if (key := self.get_bucket_key(request)) is None:
+            return True
+        return self.take(key) <= self.num_requests
+
+    def wait(self) -> float:
+        return max(self.window_end - self.timer(), 0)
+
+
+class UserBucketThrottle(CacheBucketThrottle):
+    """
+    Budget of each authenticated user, whatever address they come from.
+
+    """
+
+    scope = "user"
+
+    def get_ident_for(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class AddressBucketThrottle(CacheBucketThrottle):
+    """
+    Budget of each client address, shared by every user behind it. The address
+    is only read from X-Forwarded-For behind the NUM_PROXIES trusted proxies.
+
+    """
+
+    scope = "address"
+
+    def get_ident_for(self, request):
+        return self.get_ident(request)
+
+
+class FailedAuthenticationThrottle(AddressBucketThrottle):
+    """
+    Budget of failed authentications of each client address, from the
+    "failed_authentication" entry of DEFAULT_THROTTLE_RATES. Unlike the other
+    buckets it's only taken from by failures, and checked before the
+    credentials are, as checking a password costs a hash.
+
+    """
+
+    scope = "failed_authentication"
+
+    def get_scope(self, request) -> str:
+        return self.scope
+
+    def allow_request(self, request, view) -> bool:
+        if (key := self.get_bucket_key(request)) is None:
+            return True
+        return self.cache.get(key, 0) < self.num_requests
+
+    def record_failure(self, request) -> None:
+        if (key := self.get_bucket_key(request)) is not None:
+            self.take(key)
+
+
+class ThrottledAuthenticationMixin:
+    """
+    Makes an authentication class refuse the credentials of clients out of
+    failed authentications, and count its failures against their budget. The
+    view throttles only run after authentication, too late to spare the hash.
+
+    """
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        scheme = self.authenticate_header(request).split()[0]
+        if not auth or auth[0].lower() != scheme.lower().encode():
+            return super().authenticate(request)
+        throttle = FailedAuthenticationThrottle()
+        if not throttle.allow_request(request, None):
+            raise Throttled(throttle.wait())
+        try:
+            return super().authenticate(request)
+        except AuthenticationFailed:
+            throttle.record_failure(request)
+            raise
@@ -1,8 +1,21 @@
 from rest_framework import routers
 
-from .views import ProductViewSet, OrderViewSet
+from django.urls import path
+
+from . import async_views
+from .views import ProductViewSet, OrderViewSet, OrderQueueView, AnalyticsView
 
 router = routers.SimpleRouter()
 router.register(r"product", ProductViewSet, basename="product")
 router.register(r"order", OrderViewSet, basename="order")
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path("queue/", OrderQueueView.as_view(), name="order-queue"),
+    path("analytics/", AnalyticsView.as_view(), name="analytics"),
+    path("async/product/", async_views.product_list, name="async-product-list"),
+    path(
+        "async/product/<int:pk>/",
+        async_views.product_detail,
+        name="async-product-detail",
+    ),
+    path("async/order/<int:pk>/", async_views.order_detail, name="async-order-detail"),
+]
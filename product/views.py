@@ -1,47 +1,383 @@
+import hashlib
+import math
+
+from rest_framework import status
+from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+
+from django.conf import settings
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import get_catalog_state, get_catalog_payload, set_catalog_payload
+from .export import EXPORT_FORMATS, iter_orders
+from .feed import order_feed
+from .idempotency import idempotent
+from .models import Product, Order, OrderStatusRollup, ProductSalesRollup
+from .renderers import EventStreamRenderer
+from .serializers import (
+    ProductSerializer,
+    OrderSerializer,
+    OrderDetailChangeSerializer,
+    QueueOrderSerializer,
+    AnalyticsQuerySerializer,
+    ProductSalesRollupSerializer,
+    OrderStatusRollupSerializer,
+)
+from .throttling import AddressBucketThrottle, FailedAuthenticationThrottle
+
+
+class FastReadMixin:
+    """
+    Serves list and retrieve from .values() rows turned into the representation
+    by the fast_data of the serializer class, skipping the per object field
+    instances and to_representation calls of the serializers.
 
-from .models import Product, Order
-from .serializers import ProductSerializer, OrderSerializer
+    """
 
+    def get_fast_queryset(self):
+        return (
+            self.get_queryset()
+            .prefetch_related(None)
+            .values(*self.get_serializer_class().fast_fields)
+        )
 
-class ProductViewSet(ReadOnlyModelViewSet):
+    def list(self, request, *args, **kwargs):
+        fast_data = self.get_serializer_class().fast_data
+        queryset = self.filter_queryset(self.get_fast_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast_data(page))
+        return Response(fast_data(list(queryset)))
+
+    def retrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_fast_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, row)
+        return Response(self.get_serializer_class().fast_data([row])[0])
+
+
+class ProductViewSet(FastReadMixin, ReadOnlyModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    lookup_value_regex = "[0-9]+"
+
+    def get_catalog_response(self, request, name: str, get_response) -> Response:
+        """
+        Serves the catalog payload from the cache, falling back to the given view
+        on a miss. Responds with 304 when the client already has this version.
+
+        """
+        state = get_catalog_state()
+        headers = {
+            "ETag": f'"{state["version"]}-{name}"',
+            "Last-Modified": http_date(state["last_modified"]),
+        }
+        not_modified = get_conditional_response(
+            request._request,
+            etag=headers["ETag"],
+            last_modified=state["last_modified"],
+        )
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+
+        payload = get_catalog_payload(state, name)
+        if payload is None:
+            payload = get_response().data
+            set_catalog_payload(state, name, payload)
+        return Response(payload, headers=headers)
 
+    def list(self, request, *args, **kwargs):
+        # each page is cached on its own, keyed by the only parameters selecting
+        # it, so other query strings don't add cache entries.
+        paginator = self.paginator
+        cursor = request.query_params.get(paginator.cursor_query_param, "")
+        page = hashlib.md5(cursor.encode()).hexdigest()  # nosec
+        return self.get_catalog_response(
+            request,
+            f"list-{paginator.get_page_size(request)}-{page}",
+            lambda: super(ProductViewSet, self).list(request),
+        )
 
-class OrderViewSet(ModelViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_catalog_response(
+            request,
+            f"detail-{kwargs['pk']}",
+            lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
+
+class OrderViewSet(FastReadMixin, ModelViewSet):
     permission_classes = (IsAuthenticated,)
     serializer_class = OrderSerializer
 
+    def initial(self, request, *args, **kwargs):
+        # read before any product is, see OrderDetailSerializer.get_resolved_option.
+        self.catalog_version = get_catalog_state()["version"]
+        super().initial(request, *args, **kwargs)
+
+    def get_serializer_context(self):
+        return {
+            **super().get_serializer_context(),
+            "catalog_version": self.catalog_version,
+        }
+
     def get_queryset(self):
         queryset = Order.objects.filter(user_id=self.request.user.id)
         if self.action in ("update", "partial_update", "destroy"):
             return queryset.filter(status="W")
-        return queryset
+        return queryset.with_details()
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(user_id=self.request.user.id)
 
-    # TODO: partial update with action of + or - for addition and exclusion.
-    # e.g:
-    # {
-    #     "action": "+",
-    #     "products": [
-    #         {
-    #             "product": {
-    #                 "id": 2
-    #             },
-    #             "chosen_option": {"milk": 2}
-    #         }
-    #     ],
-    #     "action": "-",
-    #     "products": [
-    #         {
-    #             "product": {
-    #                 "id": 1
-    #             },
-    #             "chosen_option": {"milk": 2}
-    #         }
-    #     ],
-    # }
+    @idempotent
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @action(detail=False, methods=["post"])
+    @idempotent
+    def bulk(self, request, *args, **kwargs):
+        """
+        Creates a list of orders at once, responding with the result of each order.
+
+        """
+        if not isinstance(request.data, list) or not request.data:
+            raise ValidationError({"non_field_errors": "Expected a list of orders."})
+        serializer = self.get_serializer()
+        results, orders_data = [None] * len(request.data), []
+        for index, order_data in enumerate(request.data):
+            try:
+                orders_data.append((index, serializer.run_validation(order_data)))
+            except ValidationError as error:
+                results[index] = error.detail
+
+        created = serializer.bulk_create(
+            [order_data for _, order_data in orders_data],
+            user_id=request.user.id,
+        )
+        orders = Order.objects.with_details().in_bulk(
+            [order.id for order in created if isinstance(order, Order)]
+        )
+        for (index, _), order in zip(orders_data, created):
+            results[index] = order
+
+        response = [
+            {
+                "status": status.HTTP_201_CREATED,
+                "order": self.get_serializer(orders[result.id]).data,
+            }
+            if isinstance(result, Order)
+            else {"status": status.HTTP_400_BAD_REQUEST, "errors": result}
+            for result in results
+        ]
+        if all(result["status"] == status.HTTP_201_CREATED for result in response):
+            return Response(response, status=status.HTTP_201_CREATED)
+        return Response(response, status=status.HTTP_207_MULTI_STATUS)
+
+    @action(detail=False, methods=["get"])
+    def export(self, request, *args, **kwargs):
+        """
+        Streams the order history as NDJSON or CSV, chosen by the export_format
+        query parameter.
+
+        """
+        export_format = request.query_params.get("export_format", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"export_format": f"Choose one of {', '.join(EXPORT_FORMATS)}."}
+            )
+        render, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            render(iter_orders(Order.objects.filter(user_id=request.user.id))),
+            content_type=content_type,
+        )
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="orders.{export_format}"'
+        return response
+
+    @idempotent
+    def partial_update(self, request, *args, **kwargs):
+        """
+        Applies "+" and "-" changes to the order details, e.g:
+        [
+            {"action": "+", "order_details": [{"product": {"id": 2}}]},
+            {"action": "-", "order_details": [{"product": {"id": 1}}]}
+        ]
+
+        """
+        instance = self.get_object()
+        changes = OrderDetailChangeSerializer(data=request.data, many=True)
+        changes.is_valid(raise_exception=True)
+        serializer = self.get_serializer(instance)
+        serializer.change(instance, changes.validated_data)
+        return Response(serializer.data)
+
+
+class OrderQueueView(APIView):
+    """
+    The barista queue of waiting, in preparation and ready orders.
+
+    Without a cursor it responds with a snapshot of the queue and a cursor. With
+    the cursor in the since query parameter it holds the request until orders
+    change, then responds with the changed orders, delivered ones included so
+    they can be dropped, and the ids of deleted ones. Clients accepting
+    text/event-stream get the same payloads as a stream of events instead.
+    Under ASGI, the stream ends after each event, and event source clients
+    reconnect with the id of the last event to resume from it.
+
+    """
+
+    permission_classes = (IsAdminUser,)
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
+    def get_orders(self, order_ids: list = None) -> list:
+        version = get_catalog_state()["version"]
+        queryset = Order.objects.select_related("user").with_details().order_by("id")
+        if order_ids is None:
+            # matches the condition of the open orders index.
+            queryset = queryset.exclude(status="D")
+        else:
+            queryset = queryset.filter(id__in=order_ids)
+        return QueueOrderSerializer(
+            queryset, many=True, context={"catalog_version": version}
+        ).data
+
+    def get_changes(self, cursor: str, timeout: float) -> dict:
+        """
+        Waits for the orders changed after the cursor, falling back to a snapshot
+        when the cursor can't be resumed.
+
+        :return dict: changes
+        """
+        cursor, order_ids = order_feed.wait(cursor, timeout)
+        if order_ids is None:
+            return {"cursor": cursor, "snapshot": True, "orders": self.get_orders()}
+        orders = self.get_orders(order_ids) if order_ids else []
+        found_ids = {order["id"] for order in orders}
+        return {
+            "cursor": cursor,
+            "snapshot": False,
+            "orders": orders,
+            "removed": [
+                order_id for order_id in order_ids if order_id not in found_ids
+            ],
+        }
+
+    @staticmethod
+    def get_event(changes: dict) -> bytes:
+        if changes["snapshot"] or changes["orders"] or changes["removed"]:
+            return EventStreamRenderer.render_event(
+                changes,
+                event="snapshot" if changes["snapshot"] else "changes",
+                event_id=changes["cursor"],
+            )
+        # keeps proxies from closing the idle connection.
+        return b": keep-alive\n\n"
+
+    def iter_events(self, cursor: str, timeout: float):
+        while True:
+            changes = self.get_changes(cursor, timeout)
+            cursor = changes["cursor"]
+            yield self.get_event(changes)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            timeout = float(
+                request.query_params.get("timeout", settings.ORDER_QUEUE_TIMEOUT)
+            )
+        except ValueError:
+            timeout = math.nan
+        if not math.isfinite(timeout):
+            raise ValidationError({"timeout": "A number of seconds is required."})
+        timeout = min(max(timeout, 0), settings.ORDER_QUEUE_TIMEOUT)
+        cursor = request.query_params.get("since", "")
+
+        if isinstance(request.accepted_renderer, EventStreamRenderer):
+            # reconnecting clients resume from the last event they received.
+            cursor = request.META.get("HTTP_LAST_EVENT_ID", cursor)
+            # the stream waits on the feed between events instead of spinning.
+            timeout = max(timeout, settings.ORDER_QUEUE_MIN_STREAM_TIMEOUT)
+            if isinstance(request._request, ASGIRequest):
+                # the ASGI handler of Django 3.2 iterates streaming responses on
+                # the event loop, so every event is a response of its own and
+                # the client reconnects for the next one.
+                response = HttpResponse(
+                    self.get_event(self.get_changes(cursor, timeout)),
+                    content_type=EventStreamRenderer.media_type,
+                )
+            else:
+                response = StreamingHttpResponse(
+                    self.iter_events(cursor, timeout),
+                    content_type=EventStreamRenderer.media_type,
+                )
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"
+            return response
+        return Response(self.get_changes(cursor, timeout))
+
+
+class AnalyticsView(APIView):
+    """
+    Hourly sales of each product and number of orders reaching each status,
+    between the since and until query parameters, the last day by default. Read
+    from the rollups, so the cost follows the number of hours, not of orders.
+
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        hours = {
+            "hour__gte": query.validated_data["since"],
+            "hour__lte": query.validated_data["until"],
+        }
+        sales = ProductSalesRollup.objects.filter(**hours).order_by("hour", "product")
+        if "product" in query.validated_data:
+            sales = sales.filter(product_id=query.validated_data["product"])
+        statuses = OrderStatusRollup.objects.filter(**hours).order_by("hour", "status")
+        return Response(
+            {
+                "sales": ProductSalesRollupSerializer(sales, many=True).data,
+                "statuses": OrderStatusRollupSerializer(statuses, many=True).data,
+            }
+        )
+
+
+class ObtainAuthTokenView(ObtainAuthToken):
+    """
+    Token login of rest framework, throttled by client address. Failed logins
+    also count against the failed authentications of the address.
+
+    """
+
+    throttle_classes = (AddressBucketThrottle, FailedAuthenticationThrottle)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            return super().post(request, *args, **kwargs)
+        except ValidationError:
+            FailedAuthenticationThrottle().record_failure(request)
+            raise